@@ -5,177 +5,227 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
-import unicodedata
 from datetime import datetime
 from plotly.subplots import make_subplots
 
-def mostrar_analisis_estrategico():
-    # Definir constantes para estandarizar estilos de fuente
-    TITLE_FONT = dict(size=24, color='#1a365d', family='Arial', weight='bold')
-    SUBTITLE_FONT = dict(size=20, color='#2c5282', family='Arial', weight='bold')
-    AXIS_TITLE_FONT = dict(size=16, color='#2c5282', family='Arial', weight='bold')
-    LABEL_FONT = dict(size=14, color='#2d3748', family='Arial')
-    LEGEND_FONT = dict(size=14, color='#2c5282', family='Arial')
-    ANNOTATION_FONT = dict(size=14, color='#1a365d', family='Arial', weight='bold')
-    ACCENT_COLOR = '#4a86e8'
+from itertools import product
+
+from filtros import obtener_motor_filtros, SeleccionFiltrada
+from motores import plan_secciones
+from cache_lru import memoizar_por_filtros
+from geografia import agregar_codigos_iso3, agregar_coordenadas, agrupar_ciudades, config_mapas, NIVELES_DETALLE, RESOLUCION_MAPAS
+from graficos import resumen_caja, kde_en_malla, contorno_violin, anotaciones, escalar_tamanos, mostrar_figura_cacheada, MAX_ANOTACIONES
+
+# Medidas que pide cada sección. El plan calcula juntas las que comparten claves
+# y origen (cubo o transacciones)
+SEGMENTO = ['rango_edad', 'genero_cliente']
+VENTAS_CAT_PAGO = plan_secciones.pedir(['categoria', 'metodo_pago'], {'ventas': ('ventas', 'sum')})
+SATISFACCION_MES = plan_secciones.pedir(['mes_ano'], {'satisfaccion': ('satisfaccion', 'mean')})
+METRICAS_PAIS = plan_secciones.pedir(['pais'], {
+    'ventas': ('ventas', 'sum'),
+    'cantidad': ('cantidad', 'sum'),
+    'satisfaccion': ('satisfaccion', 'mean'),
+    'id_cliente': ('id_cliente', 'nunique'),
+})
+METRICAS_CIUDAD = plan_secciones.pedir(['pais', 'ciudad'], {
+    'ventas': ('ventas', 'sum'),
+    'cantidad': ('cantidad', 'sum'),
+    'satisfaccion': ('satisfaccion', 'mean'),
+})
+VENTAS_SEGMENTO = plan_secciones.pedir(SEGMENTO, {'ventas': ('ventas', 'sum')}, observed=False)
+TICKET_SEGMENTO = plan_secciones.pedir(SEGMENTO, {
+    'ventas': ('ventas', 'sum'),
+    'id_cliente': ('id_cliente', 'nunique'),
+}, observed=False)
+VENTAS_CATEGORIA = plan_secciones.pedir(['categoria'], {'ventas': ('ventas', 'sum')})
+
+# Definir constantes para estandarizar estilos de fuente
+TITLE_FONT = dict(size=24, color='#1a365d', family='Arial', weight='bold')
+SUBTITLE_FONT = dict(size=20, color='#2c5282', family='Arial', weight='bold')
+AXIS_TITLE_FONT = dict(size=16, color='#2c5282', family='Arial', weight='bold')
+LABEL_FONT = dict(size=14, color='#2d3748', family='Arial')
+LEGEND_FONT = dict(size=14, color='#2c5282', family='Arial')
+ANNOTATION_FONT = dict(size=14, color='#1a365d', family='Arial', weight='bold')
+ACCENT_COLOR = '#4a86e8'
+
+
+# Paso de cálculo de cada sección. Se memoiza por la clave normalizada de los
+# filtros, así volver a una selección anterior no recalcula nada. Los resultados
+# se comparten entre sesiones y no deben modificarse al dibujar
+
+
+@memoizar_por_filtros("barras")
+def calcular_barras(seleccion):
+    df_filtrado = seleccion.filas
+
+    # Agregar ventas por categoría × método de pago
+    ventas_cat_pago_raw = VENTAS_CAT_PAGO.resolver(seleccion)
+
+    # MODIFICADO: Usar solo las categorías filtradas, no todas las categorías originales
+    todos_metodos = sorted(ventas_cat_pago_raw["metodo_pago"].unique())
+    categorias_filtradas = sorted(ventas_cat_pago_raw["categoria"].unique())
+
+    # MODIFICADO: Crear combinaciones solo con las categorías filtradas
+    combinaciones_filtradas = pd.DataFrame(
+        list(product(categorias_filtradas, todos_metodos)),
+        columns=['categoria', 'metodo_pago']
+    )
     
-    # Estilo CSS para insights
-    INSIGHT_STYLE = """
-    <style>
-    .insight-card {
-        font-family: Arial, sans-serif;
-        background-color: #f8fafc;
-        padding: 20px;
-        border-radius: 10px;
-        border-left: 5px solid #4a86e8;
-        margin-bottom: 20px;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-    }
-    .insight-card h3 {
-        color: #1a365d;
-        font-weight: 700;
-        font-size: 20px;
-        margin-bottom: 15px;
-    }
-    .insight-card p {
-        color: #2d3748;
-        font-size: 16px;
-        line-height: 1.6;
-        margin-bottom: 15px;
-    }
-    .insight-card b {
-        font-weight: 700;
-    }
-    </style>
-    """
+    # Hacer merge solo con las categorías filtradas
+    ventas_cat_pago = combinaciones_filtradas.merge(
+        ventas_cat_pago_raw, 
+        on=['categoria', 'metodo_pago'], 
+        how='left'
+    ).fillna(0)
     
-    # Inyectar estilos CSS para insights
-    st.markdown(INSIGHT_STYLE, unsafe_allow_html=True)
-
-    # Cargar datos
-    @st.cache_data
-    def load_data():
-        try:
-            df = pd.read_excel("static/Ventas_Minoristas.xlsx")
+    # Ordenar categorías filtradas por ventas totales
+    cat_totals = ventas_cat_pago.groupby('categoria')['ventas'].sum().sort_values(ascending=False)
 
-        except Exception as e:
-            st.error(f"Error al cargar el archivo: {str(e)}")
-            return pd.DataFrame()
-        
-        # Renombrar columnas para quitar espacios y caracteres especiales
-        rename_dict = {
-            "ID_cliente": "id_cliente",
-            "Nombre_producto": "nombre_producto",
-            "Cantidad": "cantidad",
-            "Precio_unitario(USD)": "precio_unitario_usd",
-            "Fecha": "fecha",
-            "categoria": "categoria",
-            "pais": "pais",
-            "ciudad": "ciudad",
-            "metodo_pago": "metodo_pago",
-            "edad_cliente": "edad_cliente",
-            "genero_cliente": "genero_cliente",
-            "calificación_satisfaccion": "satisfaccion"  # Este es el correcto
-        }
-        
-        # Aplicar el renombramiento
-        df = df.rename(columns=rename_dict)
-        
-        # Limpiar strings: minúsculas, sin tildes, sin espacios extras
-        def limpiar_texto(x):
-            if isinstance(x, str):
-                x = x.strip().lower()
-                # Solo quitamos tildes y caracteres especiales para la mayoría de los campos
-                x = unicodedata.normalize('NFKD', x).encode('ascii', errors='ignore').decode('utf-8')
-                return x
-            return x
+    # Insight para barras apiladas
+    metodo_principal = ventas_cat_pago.groupby('metodo_pago')['ventas'].sum().idxmax()
+    porcentaje_principal = (ventas_cat_pago[ventas_cat_pago['metodo_pago'] == metodo_principal]['ventas'].sum() / 
+                          ventas_cat_pago['ventas'].sum() * 100)
+    
+    cat_principal = ventas_cat_pago.groupby('categoria')['ventas'].sum().idxmax()
+    metodo_cat_principal = ventas_cat_pago[(ventas_cat_pago['categoria'] == cat_principal)].groupby('metodo_pago')['ventas'].sum().idxmax()
+    
+    # Obtener segundo método de pago más popular
+    metodos_ventas = ventas_cat_pago.groupby('metodo_pago')['ventas'].sum().sort_values(ascending=False)
+    segundo_metodo = metodos_ventas.index[1] if len(metodos_ventas) > 1 else None
+    porcentaje_segundo = (metodos_ventas.iloc[1] / metodos_ventas.sum() * 100) if len(metodos_ventas) > 1 else 0
+    
+    # Calcular crecimiento del método principal vs año anterior si hay datos temporales
+    tendencia_texto = ""
+    if 'fecha' in df_filtrado.columns:
+        df_actual = df_filtrado[df_filtrado['fecha'] >= (df_filtrado['fecha'].max() - pd.Timedelta(days=180))]
+        df_anterior = df_filtrado[df_filtrado['fecha'] < (df_filtrado['fecha'].max() - pd.Timedelta(days=180))]
         
-        # Función especial de mapeo para países para asegurar compatibilidad con los mapas
-        def normalizar_pais(nombre_pais):
-            if not isinstance(nombre_pais, str):
-                return nombre_pais
-                
-            nombre_pais = nombre_pais.strip().lower()
+        if not df_anterior.empty and not df_actual.empty:
+            # Calcular porcentaje actual
+            pct_actual = (df_actual[df_actual['metodo_pago'] == metodo_principal]['ventas'].sum() / 
+                        df_actual['ventas'].sum() * 100)
             
-            # Diccionario de mapeo para países comunes que pueden tener problemas
-            mapeo_paises = {
-                'espana': 'Spain',
-                'españa': 'Spain',
-                'espa\xf1a': 'Spain',
-                'espanya': 'Spain',
-                'spain': 'Spain',
-                'mexico': 'Mexico',
-                'méxico': 'Mexico',
-                'peru': 'Peru',
-                'perú': 'Peru',
-                'argentina': 'Argentina',
-                'chile': 'Chile',
-                'colombia': 'Colombia',
-                'venezuela': 'Venezuela',
-                'brasil': 'Brazil',
-                'brazil': 'Brazil'
-            }
+            # Calcular porcentaje anterior
+            pct_anterior = (df_anterior[df_anterior['metodo_pago'] == metodo_principal]['ventas'].sum() / 
+                          df_anterior['ventas'].sum() * 100) if df_anterior['ventas'].sum() > 0 else 0
             
-            # Devolver el nombre de país normalizado si existe en el mapeo
-            return mapeo_paises.get(nombre_pais, nombre_pais.title())
-                
-        # Aplicar limpieza a columnas de texto comunes
-        for col in ["categoria", "ciudad", "metodo_pago", "genero_cliente", "nombre_producto"]:
-            if col in df.columns:
-                df[col] = df[col].apply(limpiar_texto)
-        
-        # Aplicar la normalización especial para países
-        if "pais" in df.columns:
-            df["pais"] = df["pais"].apply(normalizar_pais)
-
-        # Corregir tipos numéricos
-        df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce")
-        df["precio_unitario_usd"] = pd.to_numeric(df["precio_unitario_usd"], errors="coerce")
-        df["edad_cliente"] = pd.to_numeric(df["edad_cliente"], errors="coerce")
-        
-        # Procesar la columna de satisfacción
-        if "satisfaccion" in df.columns:
-            df["satisfaccion"] = pd.to_numeric(df["satisfaccion"], errors="coerce")
-        else:
-            # Si la columna no existe, buscarla silenciosamente con otros nombres posibles
-            for col in df.columns:
-                if "satisfac" in col.lower():
-                    df = df.rename(columns={col: "satisfaccion"})
-                    df["satisfaccion"] = pd.to_numeric(df["satisfaccion"], errors="coerce")
-                    break
-            else:
-                # Si no se encuentra, usar valor neutral sin mostrar advertencia
-                df["satisfaccion"] = 3.0  # Valor neutral por defecto
-        
-        # Crear columna de ventas
-        df["ventas"] = df["cantidad"] * df["precio_unitario_usd"]
-        
-        # Quitar filas con datos faltantes críticos
-        columnas_criticas = ["cantidad", "precio_unitario_usd", "ventas", "categoria", "fecha"]
-        df = df.dropna(subset=columnas_criticas)
-        
-        # Filtrar ventas no positivas
-        df = df[df["ventas"] > 0]
-        
-        # Asegurar que fecha sea datetime
-        df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-        
-        return df
+            # Calcular diferencia
+            if pct_anterior > 0:
+                diff = pct_actual - pct_anterior
+                tendencia_texto = f" Ha {('aumentado' if diff > 0 else 'disminuido')} un <b>{abs(diff):.1f}%</b> respecto al período anterior."
+
+    return dict(
+        ventas_cat_pago=ventas_cat_pago,
+        cat_totals=cat_totals,
+        metodo_principal=metodo_principal,
+        porcentaje_principal=porcentaje_principal,
+        cat_principal=cat_principal,
+        metodo_cat_principal=metodo_cat_principal,
+        segundo_metodo=segundo_metodo,
+        porcentaje_segundo=porcentaje_segundo,
+        tendencia_texto=tendencia_texto,
+    )
 
-    df = load_data()
+
+@memoizar_por_filtros("correlacion")
+def calcular_correlacion(seleccion):
+    df_filtrado = seleccion.filas
+
+    # Seleccionar columnas numéricas para correlación
+    cols_disponibles = ['edad_cliente', 'cantidad', 'precio_unitario_usd', 'ventas', 'satisfaccion']
+    
+    # Verificar que existan en el DataFrame
+    cols_correlacion = [col for col in cols_disponibles if col in df_filtrado.columns]
+    
+    # Asegurarse de que haya al menos dos columnas para calcular correlaciones
+    if len(cols_correlacion) < 2:
+        return None
+    return df_filtrado[cols_correlacion].corr().round(2)
+
+
+@memoizar_por_filtros("precios")
+def calcular_precios(seleccion):
+    # Cálculo dinámico de estadísticas por categoría con mejor separación de variables
+    precio_stats = seleccion.filas.groupby('categoria', observed=True)['precio_unitario_usd'].agg(['median', 'mean', 'std', 'min', 'max'])
+    # Ordenar categorías por precio mediano para mejor visualización
+    cat_order_price = precio_stats['median'].sort_values(ascending=False).index.tolist()
+
+    # Caja y densidad de cada categoría para dibujarlas sin enviar las filas
+    distribuciones = {}
+    for categoria, precios in seleccion.filas.groupby('categoria', observed=True)['precio_unitario_usd']:
+        malla, densidad = kde_en_malla(precios.to_numpy())
+        distribuciones[categoria] = dict(caja=resumen_caja(precios.to_numpy()), malla=malla, densidad=densidad)
+    return dict(precio_stats=precio_stats, cat_order_price=cat_order_price, distribuciones=distribuciones)
+
+
+@memoizar_por_filtros("satisfaccion")
+def calcular_satisfaccion(seleccion):
+    # Calcular satisfacción promedio por mes-año
+    return SATISFACCION_MES.resolver(seleccion)
+
+
+@memoizar_por_filtros("geo")
+def calcular_geo(seleccion):
+    # Agregar más métricas para enriquecer el mapa
+    # Código ISO-3 de cada país, con el que se dibujan los mapas
+    metricas_pais = agregar_codigos_iso3(METRICAS_PAIS.resolver(seleccion))
+    
+    # Calcular ticket promedio
+    metricas_pais['ticket_promedio'] = metricas_pais['ventas'] / metricas_pais['id_cliente']
+
+    # Calcular densidad de ventas (ventas por cantidad de clientes en cada país)
+    metricas_pais['densidad_ventas'] = metricas_pais['ventas'] / metricas_pais['id_cliente']
+    return metricas_pais
+
+
+@memoizar_por_filtros("ciudades")
+def calcular_ciudades(seleccion):
+    # Coordenadas reales de cada ciudad desde el nomenclátor local (sin geocodificar en red)
+    return agregar_coordenadas(METRICAS_CIUDAD.resolver(seleccion))
+
+
+@memoizar_por_filtros("segmentacion")
+def calcular_segmentacion(seleccion):
+    # Preparar datos para el gráfico de segmentación
+    segmentacion = VENTAS_SEGMENTO.resolver(seleccion)
+    if segmentacion.empty:
+        return dict(segmentacion=segmentacion, ticket_por_segmento=None, categorias_segmento=None)
+
+    # Calcular porcentajes para cada segmento
+    total_ventas = segmentacion['ventas'].sum()
+    segmentacion['porcentaje'] = (segmentacion['ventas'] / total_ventas * 100).round(1)
+
+    # Cálculo de ticket promedio por segmento si es posible
+    ticket_por_segmento = None
+    if 'id_cliente' in obtener_motor_filtros().df.columns:
+        ticket_por_segmento = TICKET_SEGMENTO.resolver(seleccion).set_index(SEGMENTO)
+        ticket_por_segmento['ticket_promedio'] = ticket_por_segmento['ventas'] / ticket_por_segmento['id_cliente']
+
+    # Análisis de categorías preferidas por el segmento más valioso
+    segmento_mas_valioso = segmentacion.loc[segmentacion['ventas'].idxmax()]
+    categorias_segmento = VENTAS_CATEGORIA.resolver(
+        seleccion, donde={c: segmento_mas_valioso[c] for c in SEGMENTO}
+    ).set_index('categoria')['ventas'].sort_values(ascending=False)
+
+    return dict(
+        segmentacion=segmentacion,
+        ticket_por_segmento=ticket_por_segmento,
+        categorias_segmento=categorias_segmento,
+    )
+
+
+def mostrar_analisis_estrategico():
+    # Los estilos de las tarjetas de insights están en static/estilos.css
+    # Cargar datos junto con los índices de filtrado (caché compartida por proceso)
+    motor_filtros = obtener_motor_filtros()
+    df = motor_filtros.df
     
     if df.empty:
         st.error("No se pudieron cargar los datos para el análisis estratégico.")
         return
-    
 
-    # Crear columna de mes-año para análisis temporales
-    df["mes_ano"] = df["fecha"].dt.strftime('%Y-%m')
-    
-    # Segmentación por edad para usarla en varios gráficos
-    bins = [0, 30, 45, 100]
-    labels = ['<30', '30-45', '>45']
-    df['rango_edad'] = pd.cut(df['edad_cliente'], bins=bins, labels=labels)
+    # mes_ano, rango_edad y el resto de columnas derivadas ya vienen calculadas
+    # desde la etapa cacheada de datos.py
 
     # Sidebar con filtros - Mejorado visualmente
     st.sidebar.markdown("""
@@ -267,21 +317,15 @@ def mostrar_analisis_estrategico():
     # Botón para aplicar filtros con estilo mejorado
     st.sidebar.markdown("<br>", unsafe_allow_html=True)
     
-    # Aplicar filtros automáticamente
-    df_filtrado = df.copy()
-    
-    # Aplicar filtro de países - sin lógica especial para ropa
-    if paises_seleccionados:
-        df_filtrado = df_filtrado[df_filtrado["pais"].isin(paises_seleccionados)]
-    
-
-    # AGREGADA ESTA SECCIÓN QUE FALTABA
-    # Aplicar filtro de categorías
-    if categorias_seleccionadas:
-        df_filtrado = df_filtrado[df_filtrado["categoria"].isin(categorias_seleccionadas)]
-
-    df_filtrado = df_filtrado[(df_filtrado["fecha"].dt.date >= fecha_inicio) & 
-                            (df_filtrado["fecha"].dt.date <= fecha_fin)]
+    # Aplicar filtros automáticamente con los índices precalculados. La selección
+    # solo materializa las transacciones o las celdas del cubo filtradas cuando
+    # alguna sección no encuentra su resultado en caché
+    seleccion = SeleccionFiltrada(
+        paises_seleccionados,
+        categorias_seleccionadas,
+        fecha_inicio,
+        fecha_fin
+    )
     
     # Mostrar indicadores de filtros aplicados
     st.sidebar.markdown("""
@@ -322,7 +366,7 @@ def mostrar_analisis_estrategico():
     ">
         <div style="font-size: 28px; color: #4a86e8; margin-bottom: 4px; font-weight: 900;">📊</div>
         <div class="animate-counter" style="font-size: 23px; font-weight: 900; color: #1a365d; letter-spacing: -0.7px; line-height: 1.1;">
-            {len(df_filtrado):,}
+            {seleccion.n_filas:,}
         </div>
         <div style="font-size: 13px; color: #2c5282; margin-top: 3px; font-weight: 600; letter-spacing: 0.25px;">
             transacciones analizadas
@@ -331,46 +375,21 @@ def mostrar_analisis_estrategico():
             <span style='font-style: italic;'>Datos del <b>{fecha_inicio.strftime('%d %b %Y')}</b> al <b>{fecha_fin.strftime('%d %b %Y')}</b></span>
         </div>
     </div>
-    <style>
-        @keyframes countUp {{
-            from {{ opacity: 0; transform: translateY(20px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
-        .animate-counter {{
-            animation: countUp 1.2s ease-out forwards;
-        }}
-    </style>
     """, unsafe_allow_html=True)
 
-    # 1. Gráfico de Barras Apiladas mejorado: Ventas por categoría desglosado por método de pago
-    st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Ventas por Categoría y Método de Pago</h2>", unsafe_allow_html=True)
-    
-    # MODIFICADO: Usar solo las categorías filtradas, no todas las categorías originales
-    todos_metodos = sorted(df_filtrado["metodo_pago"].unique())
-    categorias_filtradas = sorted(df_filtrado["categoria"].unique())
+    # Cada sección se dibuja como un fragmento independiente: los controles propios
+    # de una sección solo vuelven a ejecutar esa sección, no la página completa
+    mostrar_barras(seleccion)
+    mostrar_correlacion(seleccion)
+    mostrar_precios(seleccion)
+    mostrar_satisfaccion(seleccion)
+    mostrar_mapa_paises(seleccion)
+    mostrar_mapa_ciudades(seleccion)
+    mostrar_segmentacion(seleccion)
 
-    # MODIFICADO: Crear combinaciones solo con las categorías filtradas
-    from itertools import product
-    combinaciones_filtradas = pd.DataFrame(
-        list(product(categorias_filtradas, todos_metodos)),
-        columns=['categoria', 'metodo_pago']
-    )
-    
-    # Hacer groupby con los datos filtrados
-    ventas_cat_pago_raw = df_filtrado.groupby(['categoria', 'metodo_pago'])['ventas'].sum().reset_index()
-    
-    # Hacer merge solo con las categorías filtradas
-    ventas_cat_pago = combinaciones_filtradas.merge(
-        ventas_cat_pago_raw, 
-        on=['categoria', 'metodo_pago'], 
-        how='left'
-    ).fillna(0)
-    
-    # Ordenar categorías filtradas por ventas totales
-    cat_totals = ventas_cat_pago.groupby('categoria')['ventas'].sum().sort_values(ascending=False)
-    cat_order = cat_totals.index.tolist()
-    
 
+# Figura de barras apiladas de ventas por categoría y método de pago
+def figura_barras(ventas_cat_pago, cat_totals, cat_order):
     # Crear gráfico solo con categorías filtradas
     fig_barras = px.bar(
         ventas_cat_pago,
@@ -384,7 +403,7 @@ def mostrar_analisis_estrategico():
         height=600,
         custom_data=['metodo_pago']
     )
-    
+
     fig_barras.update_layout(
         title={
             'text': 'Distribución de Ventas por Categoría y Método de Pago',
@@ -442,7 +461,7 @@ def mostrar_analisis_estrategico():
             'line': {'width': 2, 'color': 'rgba(200,210,220,0.5)'},
         }]
     )
-    
+
     # Agregar texto con valores totales sobre cada barra
     for categoria in cat_order:
         total = cat_totals[categoria]
@@ -464,46 +483,35 @@ def mostrar_analisis_estrategico():
             borderpad=4,
             opacity=0.9
         )
-    
+
     # Agregar efectos interactivos
     fig_barras.update_traces(
         hovertemplate='<b>Categoría:</b> %{x}<br><b>Método de Pago:</b> %{customdata[0]}<br><b>Ventas:</b> $%{y:,.2f}<extra></extra>',
         marker=dict(line=dict(width=1, color='white'))
     )
     
-    st.plotly_chart(fig_barras, use_container_width=True)
-    
-    # Insight para barras apiladas
-    metodo_principal = ventas_cat_pago.groupby('metodo_pago')['ventas'].sum().idxmax()
-    porcentaje_principal = (ventas_cat_pago[ventas_cat_pago['metodo_pago'] == metodo_principal]['ventas'].sum() / 
-                          ventas_cat_pago['ventas'].sum() * 100)
-    
-    cat_principal = ventas_cat_pago.groupby('categoria')['ventas'].sum().idxmax()
+    return fig_barras
+
+
+@st.fragment
+def mostrar_barras(seleccion):
+    # 1. Gráfico de Barras Apiladas mejorado: Ventas por categoría desglosado por método de pago
+    st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Ventas por Categoría y Método de Pago</h2>", unsafe_allow_html=True)
     
-    # Obtener segundo método de pago más popular
-    metodos_ventas = ventas_cat_pago.groupby('metodo_pago')['ventas'].sum().sort_values(ascending=False)
-    segundo_metodo = metodos_ventas.index[1] if len(metodos_ventas) > 1 else None
-    porcentaje_segundo = (metodos_ventas[1] / metodos_ventas.sum() * 100) if len(metodos_ventas) > 1 else 0
+    datos_barras = calcular_barras(seleccion)
+    ventas_cat_pago = datos_barras["ventas_cat_pago"]
+    cat_totals = datos_barras["cat_totals"]
+    cat_order = cat_totals.index.tolist()
+
+    mostrar_figura_cacheada("barras", figura_barras, ventas_cat_pago, cat_totals, cat_order)
     
-    # Calcular crecimiento del método principal vs año anterior si hay datos temporales
-    tendencia_texto = ""
-    if 'fecha' in df_filtrado.columns:
-        df_actual = df_filtrado[df_filtrado['fecha'] >= (df_filtrado['fecha'].max() - pd.Timedelta(days=180))]
-        df_anterior = df_filtrado[df_filtrado['fecha'] < (df_filtrado['fecha'].max() - pd.Timedelta(days=180))]
-        
-        if not df_anterior.empty and not df_actual.empty:
-            # Calcular porcentaje actual
-            pct_actual = (df_actual[df_actual['metodo_pago'] == metodo_principal]['ventas'].sum() / 
-                        df_actual['ventas'].sum() * 100)
-            
-            # Calcular porcentaje anterior
-            pct_anterior = (df_anterior[df_anterior['metodo_pago'] == metodo_principal]['ventas'].sum() / 
-                          df_anterior['ventas'].sum() * 100) if df_anterior['ventas'].sum() > 0 else 0
-            
-            # Calcular diferencia
-            if pct_anterior > 0:
-                diff = pct_actual - pct_anterior
-                tendencia_texto = f" Ha {('aumentado' if diff > 0 else 'disminuido')} un <b>{abs(diff):.1f}%</b> respecto al período anterior."
+    # Insight para barras apiladas
+    metodo_principal = datos_barras["metodo_principal"]
+    porcentaje_principal = datos_barras["porcentaje_principal"]
+    cat_principal = datos_barras["cat_principal"]
+    segundo_metodo = datos_barras["segundo_metodo"]
+    porcentaje_segundo = datos_barras["porcentaje_segundo"]
+    tendencia_texto = datos_barras["tendencia_texto"]
     
     st.markdown(f"""
     <div class='insight-card'>
@@ -512,7 +520,7 @@ def mostrar_analisis_estrategico():
     del total de ventas.{f" Le sigue <b>{segundo_metodo.title()}</b> con un <b>{porcentaje_segundo:.1f}%</b>." if segundo_metodo else ""}{tendencia_texto}</p>
     
     <p>La categoría con mayor volumen de ventas es <b>{cat_principal.title()}</b>, y muestra una preferencia de pago mediante 
-    <b>{ventas_cat_pago[(ventas_cat_pago['categoria'] == cat_principal)].groupby('metodo_pago')['ventas'].sum().idxmax().title()}</b>.</p>
+    <b>{datos_barras["metodo_cat_principal"].title()}</b>.</p>
     
     <p><b>Implicaciones estratégicas:</b></p>
     <ul>
@@ -524,19 +532,79 @@ def mostrar_analisis_estrategico():
     </ul>
     </div>
     """, unsafe_allow_html=True)
+
+
+# Figura del mapa de calor de correlaciones
+def figura_correlacion(matriz_corr, nombre_variables):
+    # Transformar etiquetas para mejor visualización
+    etiquetas_x = [nombre_variables.get(col, col) for col in matriz_corr.columns]
+    etiquetas_y = [nombre_variables.get(col, col) for col in matriz_corr.index]
+
+    # Crear máscara para la matriz triangular superior (incluyendo diagonal)
+    mask = np.zeros_like(matriz_corr, dtype=bool)
+    mask[np.triu_indices_from(mask, 0)] = True
+    matriz_corr_lower = matriz_corr.mask(mask)
+
+    # Crear heatmap con diseño mejorado
+    fig_heatmap = px.imshow(
+        matriz_corr_lower,
+        text_auto=True,
+        color_continuous_scale='RdBu_r',  # Escala rojo-azul, mejor para correlaciones
+        labels=dict(color="Coeficiente"),
+        x=etiquetas_x,
+        y=etiquetas_y,
+        zmin=-1,
+        zmax=1,
+        height=600,
+        aspect="auto"
+    )
+
+    fig_heatmap.update_layout(
+        title={
+            'text': 'Matriz de Correlación entre Variables Clave',
+            'y': 0.95,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': TITLE_FONT
+        },
+        xaxis={'title': ''},
+        yaxis={'title': ''},
+        font=LABEL_FONT,
+        plot_bgcolor='rgba(240,249,255,0.95)',
+        coloraxis_colorbar=dict(
+            title=dict(text="<b>Correlación</b>", font=LEGEND_FONT),
+            # titlefont=dict(size=14),  # Esta línea causa el error - eliminada
+            ticks="outside",
+            tickfont=dict(size=12),
+            len=0.6,
+            thickness=20,
+            outlinewidth=1,
+            outlinecolor='rgba(200,210,220,0.5)',
+            x=1.1
+        ),
+    )
+
+    # Mejorar texto y formato
+    fig_heatmap.update_traces(
+        text=[[f'{val:.2f}' if not np.isnan(val) else '' for val in row] for row in matriz_corr_lower.values],
+        texttemplate='%{text}',
+        textfont=dict(size=12, family='Arial', color='black'),
+        hovertemplate='<b>%{y}</b> vs <b>%{x}</b><br>Correlación: %{z:.3f}<extra></extra>'
+    )
     
+    return fig_heatmap
+
+
+@st.fragment
+def mostrar_correlacion(seleccion):
     # 2. Heatmap mejorado: Correlación entre variables clave
     st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Correlación entre Variables Clave</h2>", unsafe_allow_html=True)
     
-    # Seleccionar columnas numéricas para correlación
-    cols_disponibles = ['edad_cliente', 'cantidad', 'precio_unitario_usd', 'ventas', 'satisfaccion']
-    
-    # Verificar que existan en el DataFrame
-    cols_correlacion = [col for col in cols_disponibles if col in df_filtrado.columns]
+    # Matriz de correlación entre columnas numéricas (None si hay menos de dos)
+    matriz_corr = calcular_correlacion(seleccion)
     
-    # Asegurarse de que haya al menos dos columnas para calcular correlaciones
-    if len(cols_correlacion) >= 2:
-        matriz_corr = df_filtrado[cols_correlacion].corr().round(2)
+    if matriz_corr is not None:
         
         # Crear heatmap mejorado con plotly
         nombre_variables = {
@@ -547,64 +615,7 @@ def mostrar_analisis_estrategico():
             'satisfaccion': 'Satisfacción'
         }
         
-        # Transformar etiquetas para mejor visualización
-        etiquetas_x = [nombre_variables.get(col, col) for col in matriz_corr.columns]
-        etiquetas_y = [nombre_variables.get(col, col) for col in matriz_corr.index]
-        
-        # Crear máscara para la matriz triangular superior (incluyendo diagonal)
-        mask = np.zeros_like(matriz_corr, dtype=bool)
-        mask[np.triu_indices_from(mask, 0)] = True
-        matriz_corr_lower = matriz_corr.mask(mask)
-        
-        # Crear heatmap con diseño mejorado
-        fig_heatmap = px.imshow(
-            matriz_corr_lower,
-            text_auto=True,
-            color_continuous_scale='RdBu_r',  # Escala rojo-azul, mejor para correlaciones
-            labels=dict(color="Coeficiente"),
-            x=etiquetas_x,
-            y=etiquetas_y,
-            zmin=-1,
-            zmax=1,
-            height=600,
-            aspect="auto"
-        )
-        
-        fig_heatmap.update_layout(
-            title={
-                'text': 'Matriz de Correlación entre Variables Clave',
-                'y': 0.95,
-                'x': 0.5,
-                'xanchor': 'center',
-                'yanchor': 'top',
-                'font': TITLE_FONT
-            },
-            xaxis={'title': ''},
-            yaxis={'title': ''},
-            font=LABEL_FONT,
-            plot_bgcolor='rgba(240,249,255,0.95)',
-            coloraxis_colorbar=dict(
-                title=dict(text="<b>Correlación</b>", font=LEGEND_FONT),
-                # titlefont=dict(size=14),  # Esta línea causa el error - eliminada
-                ticks="outside",
-                tickfont=dict(size=12),
-                len=0.6,
-                thickness=20,
-                outlinewidth=1,
-                outlinecolor='rgba(200,210,220,0.5)',
-                x=1.1
-            ),
-        )
-        
-        # Mejorar texto y formato
-        fig_heatmap.update_traces(
-            text=[[f'{val:.2f}' if not np.isnan(val) else '' for val in row] for row in matriz_corr_lower.values],
-            texttemplate='%{text}',
-            textfont=dict(size=12, family='Arial', color='black'),
-            hovertemplate='<b>%{y}</b> vs <b>%{x}</b><br>Correlación: %{z:.3f}<extra></extra>'
-        )
-        
-        st.plotly_chart(fig_heatmap, use_container_width=True)
+        mostrar_figura_cacheada("correlacion", figura_correlacion, matriz_corr, nombre_variables)
         
         # Insight para heatmap
         try:
@@ -696,77 +707,79 @@ def mostrar_analisis_estrategico():
     else:
         st.warning("No hay suficientes columnas numéricas para calcular correlaciones.")
 
-    # 3. Boxplot mejorado: Comparar distribución de precios por categoría
-    st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Distribución de Precios por Categoría</h2>", unsafe_allow_html=True)
-    
-    # Ordenar categorías por precio mediano para mejor visualización
-    cat_median = df_filtrado.groupby('categoria')['precio_unitario_usd'].median().sort_values(ascending=False)
-    cat_order_price = cat_median.index.tolist()
-    
+
+# Figura de cajas y violines de precios por categoría
+def figura_precios(datos_precios, cat_order_price, superponer_violin):
     # Crear paleta de colores personalizada
     n_cats = len(cat_order_price)
     colors = px.colors.qualitative.Vivid[:n_cats] if n_cats <= len(px.colors.qualitative.Vivid) else px.colors.qualitative.Vivid
-    
-    fig_boxplot = px.box(
-        df_filtrado,
-        x="categoria",
-        y="precio_unitario_usd",
-        color="categoria",
-        category_orders={"categoria": cat_order_price},
-        points="outliers",  # Solo mostrar outliers para reducir carga visual
-        notched=True,  # Agregar muescas para mejor comparación visual
-        color_discrete_sequence=colors,
-        labels={
-            'precio_unitario_usd': 'Precio Unitario (USD)',
-            'categoria': 'Categoría'
-        },
-        height=600
-    )
-    
-    # Agregar violin plot superpuesto para ver distribución completa
-    fig_violin = px.violin(
-        df_filtrado,
-        x="categoria",
-        y="precio_unitario_usd",
-        color="categoria",
-        category_orders={"categoria": cat_order_price},
-        color_discrete_sequence=colors,
-        # opacity=0.2,  # Esta línea causa el error - eliminada
-        box=False,
-    )
-    
-    # Crear copia de las trazas violín con opacidad personalizada manualmente
-    violin_traces = []
-    for trace in fig_violin.data:
-        # Crear una copia del trace original
-        new_trace = go.Violin(
-            x=trace.x,
-            y=trace.y,
-            name=trace.name,
-            legendgroup=trace.legendgroup,
-            scalegroup=trace.scalegroup,
-            side=trace.side,
-            line=trace.line,
-            fillcolor=trace.fillcolor,
-            marker=trace.marker,
-            hoverinfo="skip",  # Ocultar información de hover para el violín
-            showlegend=False,  # No mostrar en leyenda
-            opacity=0.2  # Aquí aplicamos la opacidad directamente
-        )
-        violin_traces.append(new_trace)
-    
-    # Combinar gráficos (primero los violines con opacidad, luego el boxplot)
-    for trace in violin_traces:
-        fig_boxplot.add_trace(trace)
-    
-    # Agregar mediana y promedio como anotaciones
-    precio_stats = df_filtrado.groupby('categoria')['precio_unitario_usd'].agg(['median', 'mean']).reset_index()
-    
-    for i, row in precio_stats.iterrows():
-        fig_boxplot.add_annotation(
-            x=row['categoria'],
-            y=row['median'],
-            text=f"Mediana: ${row['median']:.2f}",
+
+    # Cajas y violines se dibujan con estadísticas calculadas en el servidor: el
+    # gráfico lleva cuartiles, bigotes, una muestra acotada de atípicos y la
+    # densidad en una malla fija, no todas las filas de precios
+    distribuciones = datos_precios["distribuciones"]
+    precio_stats = datos_precios["precio_stats"].reindex(cat_order_price)
+    # Con demasiadas categorías la mediana y el promedio solo se muestran en el hover
+    con_anotaciones = n_cats <= MAX_ANOTACIONES
+    fig_boxplot = go.Figure()
+
+    for i, categoria in enumerate(cat_order_price):
+        dist = distribuciones[categoria]
+        color = colors[i % len(colors)]
+
+        # Violín superpuesto para ver la distribución completa (opacidad baja)
+        if superponer_violin:
+            xs, ys = contorno_violin(i, dist["malla"], dist["densidad"])
+            fig_boxplot.add_trace(go.Scatter(
+                x=xs,
+                y=ys,
+                mode="lines",
+                fill="toself",
+                fillcolor=color,
+                line=dict(color=color, width=1),
+                opacity=0.2,
+                hoverinfo="skip",  # Ocultar información de hover para el violín
+                showlegend=False
+            ))
+
+        caja = dist["caja"]
+        hover_caja = f'<b>{categoria}</b><br>Precio: $%{{y:.2f}}'
+        if not con_anotaciones:
+            hover_caja += f'<br>Mediana: ${caja["mediana"]:.2f}<br>Promedio: ${caja["media"]:.2f}'
+        fig_boxplot.add_trace(go.Box(
+            x=[i],
+            q1=[caja["q1"]],
+            median=[caja["mediana"]],
+            q3=[caja["q3"]],
+            mean=[caja["media"]],
+            lowerfence=[caja["limite_inferior"]],
+            upperfence=[caja["limite_superior"]],
+            notchspan=[caja["muesca"]],
+            notched=True,  # Agregar muescas para mejor comparación visual
+            name=categoria,
+            marker_color=color,
+            width=0.5,
+            hovertemplate=hover_caja + '<extra></extra>'
+        ))
+
+        # Solo mostrar outliers para reducir carga visual
+        if len(caja["atipicos"]):
+            fig_boxplot.add_trace(go.Scatter(
+                x=np.full(len(caja["atipicos"]), i),
+                y=caja["atipicos"],
+                mode="markers",
+                marker=dict(color=color, size=6),
+                name=categoria,
+                hovertemplate=f'<b>{categoria}</b><br>Precio: $%{{y:.2f}}<extra></extra>'
+            ))
+
+    # Agregar las medianas como anotaciones, todas en una sola actualización del layout
+    if con_anotaciones:
+        medianas = precio_stats['median']
+        fig_boxplot.update_layout(annotations=anotaciones(
+            np.arange(n_cats),
+            medianas.to_numpy(),
+            "Mediana: $" + medianas.map('{:.2f}'.format),
             showarrow=True,
             arrowhead=2,
             arrowsize=1,
@@ -779,8 +792,8 @@ def mostrar_analisis_estrategico():
             borderwidth=1,
             borderpad=3,
             opacity=0.9
-        )
-    
+        ))
+
     fig_boxplot.update_layout(
         title={
             'text': 'Distribución de Precios por Categoría de Producto',
@@ -801,7 +814,14 @@ def mostrar_analisis_estrategico():
         font=LABEL_FONT,
         showlegend=False,
         plot_bgcolor='rgba(240,249,255,0.95)',
-        xaxis={'categoryorder': 'array', 'categoryarray': cat_order_price, 'tickangle': -45},
+        height=600,
+        xaxis={
+            'tickmode': 'array',
+            'tickvals': list(range(len(cat_order_price))),
+            'ticktext': cat_order_price,
+            'range': [-0.5, len(cat_order_price) - 0.5],
+            'tickangle': -45
+        },
         yaxis=dict(
             tickfont=dict(size=12),
             tickprefix='$',
@@ -813,18 +833,35 @@ def mostrar_analisis_estrategico():
         hoverlabel=dict(bgcolor="white", font_size=12, font_family="Arial"),
         margin=dict(l=60, r=20, t=80, b=120)
     )
-    
+
     # Agregar efectos interactivos
-    fig_boxplot.update_traces(
-        hovertemplate='<b>%{x}</b><br>Precio: $%{y:.2f}<extra></extra>',
-        marker=dict(opacity=0.7)
+    fig_boxplot.update_traces(marker=dict(opacity=0.7), selector=dict(type='box'))
+    fig_boxplot.update_traces(marker=dict(opacity=0.7), selector=dict(mode='markers'))
+    
+    return fig_boxplot
+
+
+@st.fragment
+def mostrar_precios(seleccion):
+    # 3. Boxplot mejorado: Comparar distribución de precios por categoría
+    st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Distribución de Precios por Categoría</h2>", unsafe_allow_html=True)
+    
+    # Control propio de la sección: al cambiarlo solo se vuelve a dibujar este fragmento
+    superponer_violin = st.toggle(
+        "Superponer distribución completa (violín)",
+        value=True,
+        key="precios_violin"
     )
     
-    st.plotly_chart(fig_boxplot, use_container_width=True)
+    # Ordenar categorías por precio mediano para mejor visualización
+    datos_precios = calcular_precios(seleccion)
+    cat_order_price = datos_precios["cat_order_price"]
+    
+    mostrar_figura_cacheada("precios", figura_precios, datos_precios, cat_order_price, superponer_violin)
     
     # Insight para boxplot
-    # Cálculo dinámico de estadísticas por categoría con mejor separación de variables
-    precio_stats = df_filtrado.groupby('categoria')['precio_unitario_usd'].agg(['median', 'mean', 'std', 'min', 'max'])
+    # Estadísticas por categoría ya calculadas en calcular_precios
+    precio_stats = datos_precios["precio_stats"]
     categoria_mas_cara = precio_stats['median'].idxmax()
     categoria_mas_barata = precio_stats['median'].idxmin()
     categoria_mas_variada = precio_stats['std'].idxmax()
@@ -889,184 +926,193 @@ def mostrar_analisis_estrategico():
     </p>
     </div>
     """, unsafe_allow_html=True)
+
+
+# Figura de la evolución mensual de la satisfacción
+def figura_satisfaccion(satisfaccion_tiempo):
+    # Crear un gráfico combinado: línea principal, área sombreada, y punto destacado
+    fig_linea = go.Figure()
+
+    # Añadir área sombreada bajo la línea
+    fig_linea.add_trace(
+        go.Scatter(
+            x=satisfaccion_tiempo['mes_ano'],
+            y=satisfaccion_tiempo['satisfaccion'],
+            fill='tozeroy',
+            fillcolor='rgba(74, 134, 232, 0.2)',
+            line=dict(color='rgba(0,0,0,0)'),
+            showlegend=False,
+            hoverinfo='skip'
+        )
+    )
+
+    # Añadir línea de tendencia
+    x_numeric = np.arange(len(satisfaccion_tiempo))
+    y = satisfaccion_tiempo['satisfaccion'].values
+    z = np.polyfit(x_numeric, y, 1)
+    p = np.poly1d(z)
+    trend_y = p(x_numeric)
+
+    fig_linea.add_trace(
+        go.Scatter(
+            x=satisfaccion_tiempo['mes_ano'],
+            y=trend_y,
+            mode='lines',
+            line=dict(color='rgba(200, 50, 100, 0.7)', width=2, dash='dash'),
+            name='Tendencia',
+            hovertemplate='Tendencia: %{y:.2f}<extra></extra>'
+        )
+    )
+
+    # Añadir línea principal con marcadores
+    fig_linea.add_trace(
+        go.Scatter(
+            x=satisfaccion_tiempo['mes_ano'],
+            y=satisfaccion_tiempo['satisfaccion'],
+            mode='lines+markers',
+            line=dict(color='#4a86e8', width=3),
+            marker=dict(
+                size=10,
+                color='#4a86e8',
+                line=dict(color='white', width=2)
+            ),
+            name='Satisfacción',
+            hovertemplate='%{x}<br>Satisfacción: %{y:.2f}/5<extra></extra>'
+        )
+    )
+
+    # Destacar punto máximo
+    max_idx = satisfaccion_tiempo['satisfaccion'].idxmax()
+    max_mes = satisfaccion_tiempo.loc[max_idx, 'mes_ano']
+    max_sat = satisfaccion_tiempo.loc[max_idx, 'satisfaccion']
+
+    # Punto destacado
+    fig_linea.add_trace(
+        go.Scatter(
+            x=[max_mes],
+            y=[max_sat],
+            mode='markers',
+            marker=dict(
+                symbol='star',
+                size=18,
+                color='gold',
+                line=dict(color='black', width=2)
+            ),
+            name='Máxima satisfacción',
+            hovertemplate='%{x}<br>Satisfacción máxima: %{y:.2f}/5<extra></extra>'
+        )
+    )
+
+    # Mejoras visuales del layout
+    fig_linea.update_layout(
+        title={
+            'text': 'Evolución de la Satisfacción del Cliente a lo Largo del Tiempo',
+            'y': 0.95,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': TITLE_FONT
+        },
+        xaxis_title={
+            'text': '<b>Período</b>',
+            'font': AXIS_TITLE_FONT
+        },
+        yaxis_title={
+            'text': '<b>Satisfacción Promedio (1-5)</b>',
+            'font': AXIS_TITLE_FONT
+        },
+        font=LABEL_FONT,
+        plot_bgcolor='rgba(240,249,255,0.95)',
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(200,210,220,0.25)',
+            tickfont=dict(size=12),
+            tickangle=-45
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(200,210,220,0.25)',
+            tickfont=dict(size=12),
+            range=[max(0, min(satisfaccion_tiempo['satisfaccion']) * 0.9), 5.1]
+        ),
+        legend=dict(
+            orientation="v",
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=1.25,
+            bgcolor='rgba(255,255,255,0.8)'
+        ),
+        shapes=[
+            # Línea horizontal en 4/5 (buena satisfacción)
+            dict(
+                type="line",
+                x0=0,
+                y0=4,
+                x1=1,
+                y1=4,
+                xref="paper",
+                line=dict(
+                    color="rgba(0, 150, 0, 0.3)",
+                    width=2,
+                    dash="dot",
+                )
+            ),
+            # Línea horizontal en 3/5 (satisfacción neutral)
+            dict(
+                type="line",
+                x0=0,
+                y0=3,
+                x1=1,
+                y1=3,
+                xref="paper",
+                line=dict(
+                    color="rgba(150, 150, 0, 0.3)",
+                    width=2,
+                    dash="dot",
+                )
+            )
+        ],
+        annotations=[
+            dict(
+                x=1.02,
+                y=4,
+                xref="paper",
+                yref="y",
+                text="Buena",
+                showarrow=False,
+                font=dict(size=12, color="rgba(0, 150, 0, 0.7)")
+            ),
+            dict(
+                x=1.02,
+                y=3,
+                xref="paper",
+                yref="y",
+                text="Neutral",
+                showarrow=False,
+                font=dict(size=12, color="rgba(150, 150, 0, 0.7)")
+            ),
+        ],
+        hovermode='x unified',
+        margin=dict(l=60, r=400, t=80, b=140),
+    )
     
+    return fig_linea
+
+
+@st.fragment
+def mostrar_satisfaccion(seleccion):
     # 4. Gráfico de Líneas: Evolución de satisfacción
     st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Evolución de la Satisfacción del Cliente</h2>", unsafe_allow_html=True)
     
-    if 'satisfaccion' in df_filtrado.columns:
+    # Las columnas se consultan en la tabla completa, sin materializar las filas filtradas
+    if 'satisfaccion' in obtener_motor_filtros().df.columns:
         # Calcular satisfacción promedio por mes-año
-        satisfaccion_tiempo = df_filtrado.groupby('mes_ano')['satisfaccion'].mean().reset_index()
+        satisfaccion_tiempo = calcular_satisfaccion(seleccion)
         
         # Verificar que haya datos después del agrupamiento
         if not satisfaccion_tiempo.empty and len(satisfaccion_tiempo) > 1:
-            # Crear un gráfico combinado: línea principal, área sombreada, y punto destacado
-            fig_linea = go.Figure()
-            
-            # Añadir área sombreada bajo la línea
-            fig_linea.add_trace(
-                go.Scatter(
-                    x=satisfaccion_tiempo['mes_ano'],
-                    y=satisfaccion_tiempo['satisfaccion'],
-                    fill='tozeroy',
-                    fillcolor='rgba(74, 134, 232, 0.2)',
-                    line=dict(color='rgba(0,0,0,0)'),
-                    showlegend=False,
-                    hoverinfo='skip'
-                )
-            )
-            
-            # Añadir línea de tendencia
-            x_numeric = np.arange(len(satisfaccion_tiempo))
-            y = satisfaccion_tiempo['satisfaccion'].values
-            z = np.polyfit(x_numeric, y, 1)
-            p = np.poly1d(z)
-            trend_y = p(x_numeric)
-            
-            fig_linea.add_trace(
-                go.Scatter(
-                    x=satisfaccion_tiempo['mes_ano'],
-                    y=trend_y,
-                    mode='lines',
-                    line=dict(color='rgba(200, 50, 100, 0.7)', width=2, dash='dash'),
-                    name='Tendencia',
-                    hovertemplate='Tendencia: %{y:.2f}<extra></extra>'
-                )
-            )
-            
-            # Añadir línea principal con marcadores
-            fig_linea.add_trace(
-                go.Scatter(
-                    x=satisfaccion_tiempo['mes_ano'],
-                    y=satisfaccion_tiempo['satisfaccion'],
-                    mode='lines+markers',
-                    line=dict(color='#4a86e8', width=3),
-                    marker=dict(
-                        size=10,
-                        color='#4a86e8',
-                        line=dict(color='white', width=2)
-                    ),
-                    name='Satisfacción',
-                    hovertemplate='%{x}<br>Satisfacción: %{y:.2f}/5<extra></extra>'
-                )
-            )
-            
-            # Destacar punto máximo
-            max_idx = satisfaccion_tiempo['satisfaccion'].idxmax()
-            max_mes = satisfaccion_tiempo.loc[max_idx, 'mes_ano']
-            max_sat = satisfaccion_tiempo.loc[max_idx, 'satisfaccion']
-            
-            # Punto destacado
-            fig_linea.add_trace(
-                go.Scatter(
-                    x=[max_mes],
-                    y=[max_sat],
-                    mode='markers',
-                    marker=dict(
-                        symbol='star',
-                        size=18,
-                        color='gold',
-                        line=dict(color='black', width=2)
-                    ),
-                    name='Máxima satisfacción',
-                    hovertemplate='%{x}<br>Satisfacción máxima: %{y:.2f}/5<extra></extra>'
-                )
-            )
-            
-            # Mejoras visuales del layout
-            fig_linea.update_layout(
-                title={
-                    'text': 'Evolución de la Satisfacción del Cliente a lo Largo del Tiempo',
-                    'y': 0.95,
-                    'x': 0.5,
-                    'xanchor': 'center',
-                    'yanchor': 'top',
-                    'font': TITLE_FONT
-                },
-                xaxis_title={
-                    'text': '<b>Período</b>',
-                    'font': AXIS_TITLE_FONT
-                },
-                yaxis_title={
-                    'text': '<b>Satisfacción Promedio (1-5)</b>',
-                    'font': AXIS_TITLE_FONT
-                },
-                font=LABEL_FONT,
-                plot_bgcolor='rgba(240,249,255,0.95)',
-                xaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(200,210,220,0.25)',
-                    tickfont=dict(size=12),
-                    tickangle=-45
-                ),
-                yaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(200,210,220,0.25)',
-                    tickfont=dict(size=12),
-                    range=[max(0, min(satisfaccion_tiempo['satisfaccion']) * 0.9), 5.1]
-                ),
-                legend=dict(
-                    orientation="v",
-                    yanchor="top",
-                    y=1,
-                    xanchor="left",
-                    x=1.25,
-                    bgcolor='rgba(255,255,255,0.8)'
-                ),
-                shapes=[
-                    # Línea horizontal en 4/5 (buena satisfacción)
-                    dict(
-                        type="line",
-                        x0=0,
-                        y0=4,
-                        x1=1,
-                        y1=4,
-                        xref="paper",
-                        line=dict(
-                            color="rgba(0, 150, 0, 0.3)",
-                            width=2,
-                            dash="dot",
-                        )
-                    ),
-                    # Línea horizontal en 3/5 (satisfacción neutral)
-                    dict(
-                        type="line",
-                        x0=0,
-                        y0=3,
-                        x1=1,
-                        y1=3,
-                        xref="paper",
-                        line=dict(
-                            color="rgba(150, 150, 0, 0.3)",
-                            width=2,
-                            dash="dot",
-                        )
-                    )
-                ],
-                annotations=[
-                    dict(
-                        x=1.02,
-                        y=4,
-                        xref="paper",
-                        yref="y",
-                        text="Buena",
-                        showarrow=False,
-                        font=dict(size=12, color="rgba(0, 150, 0, 0.7)")
-                    ),
-                    dict(
-                        x=1.02,
-                        y=3,
-                        xref="paper",
-                        yref="y",
-                        text="Neutral",
-                        showarrow=False,
-                        font=dict(size=12, color="rgba(150, 150, 0, 0.7)")
-                    ),
-                ],
-                hovermode='x unified',
-                margin=dict(l=60, r=400, t=80, b=140),
-            )
-            
-            st.plotly_chart(fig_linea, use_container_width=True)
+            mostrar_figura_cacheada("satisfaccion", figura_satisfaccion, satisfaccion_tiempo)
             
             # Insight para gráfico de líneas
             primer_valor = satisfaccion_tiempo.iloc[0]['satisfaccion']
@@ -1164,33 +1210,16 @@ def mostrar_analisis_estrategico():
         # Eliminar advertencia y mostrar un espacio vacío
         st.write("")
 
-    # 5. Mapa Coroplético: Distribución geográfica
-    st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Distribución Geográfica de Ventas</h2>", unsafe_allow_html=True)
-    
-    ventas_pais = df_filtrado.groupby('pais')['ventas'].sum().reset_index()
-    
-    # Agregar más métricas para enriquecer el mapa
-    metricas_pais = df_filtrado.groupby('pais').agg({
-        'ventas': 'sum',
-        'cantidad': 'sum',
-        'id_cliente': 'nunique'  # Clientes únicos
-    }).reset_index()
-    
-    # Agregar satisfacción promedio si existe
-    if 'satisfaccion' in df_filtrado.columns:
-        sat_pais = df_filtrado.groupby('pais')['satisfaccion'].mean().reset_index()
-        metricas_pais = metricas_pais.merge(sat_pais, on='pais', how='left')
-    
-    # Calcular ticket promedio
-    metricas_pais['ticket_promedio'] = metricas_pais['ventas'] / metricas_pais['id_cliente']
-
 
-    
-    # Crear mapa coroplético interactivo mejorado
+# Figura del mapa coroplético por país: capa base del mapa geográfico
+def figura_mapa_paises(metricas_pais):
+    # Crear mapa coroplético interactivo mejorado. Los países se ubican por su
+    # código ISO-3; los que no tienen código ya se avisaron al cargar los datos
+    metricas_pais = metricas_pais.dropna(subset=['pais_iso3'])
     fig_mapa = px.choropleth(
         metricas_pais,
-        locations='pais',
-        locationmode='country names',
+        locations='pais_iso3',
+        locationmode='ISO-3',
         color='ventas',
         hover_name='pais',
         color_continuous_scale='Plasma',
@@ -1213,9 +1242,6 @@ def mostrar_analisis_estrategico():
         
     hover_template += '<extra></extra>'
     
-    # Mostrar países incluidos para debugging
-    st.info(f"Países en el análisis: {', '.join(metricas_pais['pais'].tolist())}")
-    
     fig_mapa.update_traces(
         hovertemplate=hover_template,
         marker_line_color='white',
@@ -1254,8 +1280,46 @@ def mostrar_analisis_estrategico():
         autosize=False,
         dragmode='pan',
     )
+    # Misma resolución que el topojson incluido en static/
+    fig_mapa.update_geos(resolution=RESOLUCION_MAPAS)
+    return fig_mapa
+
+
+@st.fragment
+def mostrar_mapa_paises(seleccion):
+    # 5. Mapa Coroplético: Distribución geográfica
+    st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Distribución Geográfica de Ventas</h2>", unsafe_allow_html=True)
+    
+    # Métricas por país: ventas, cantidad, clientes únicos, satisfacción y ticket promedio
+    metricas_pais = calcular_geo(seleccion)
+
+    # Mostrar países incluidos para debugging
+    st.info(f"Países en el análisis: {', '.join(metricas_pais['pais'].tolist())}")
     
-    st.plotly_chart(fig_mapa, use_container_width=True)
+    # Controles propios del mapa: nivel de detalle de las burbujas de ciudad y
+    # acercamiento a un país. Al cambiarlos solo se vuelve a dibujar este fragmento
+    col_detalle, col_foco = st.columns(2)
+    with col_detalle:
+        nivel_detalle = st.select_slider(
+            "Detalle de ciudades",
+            options=list(NIVELES_DETALLE),
+            value="Región",
+            key="mapa_detalle"
+        )
+    with col_foco:
+        pais_foco = st.selectbox(
+            "Acercar a",
+            ["Todos los países"] + metricas_pais['pais'].astype(str).tolist(),
+            key="mapa_foco"
+        )
+    pais_foco = None if pais_foco == "Todos los países" else pais_foco
+
+    # Un solo mapa con las capas de países y ciudades: la geometría de los países se
+    # envía una vez y las capas se alternan en el navegador, sin rerun
+    mostrar_figura_cacheada(
+        "mapa_geo", figura_mapa_geo, metricas_pais, calcular_ciudades(seleccion),
+        NIVELES_DETALLE[nivel_detalle], pais_foco, config=config_mapas()
+    )
     
     # Insight para el mapa coroplético de países
     pais_mas_ventas = metricas_pais.loc[metricas_pais['ventas'].idxmax()]
@@ -1295,8 +1359,7 @@ def mostrar_analisis_estrategico():
                           f"({participacion_principal:.1f}% del total). Sin embargo, <b>{pais_mayor_ticket['pais']}</b> destaca con el mayor ticket promedio " + \
                           f"de <b>${pais_mayor_ticket['ticket_promedio']:,.2f}</b> por cliente, un {diferencia_ticket:.1f}% superior al promedio general."
     
-    # Calcular densidad de ventas (ventas por cantidad de clientes en cada país)
-    metricas_pais['densidad_ventas'] = metricas_pais['ventas'] / metricas_pais['id_cliente']
+    # Densidad de ventas (ventas por cantidad de clientes en cada país)
     pais_mayor_densidad = metricas_pais.loc[metricas_pais['densidad_ventas'].idxmax()]
     
     # Generar recomendaciones específicas según los datos
@@ -1354,50 +1417,43 @@ def mostrar_analisis_estrategico():
     </div>
     """, unsafe_allow_html=True)
 
-    # 6. Mapa de Burbujas mejorado: Combinar con análisis
-    ventas_ciudad = df_filtrado.groupby(['pais', 'ciudad']).agg({
-        'ventas': 'sum',
-        'cantidad': 'sum'
-    }).reset_index()
-    
-    # Agregar satisfacción solo si existe la columna
-    if 'satisfaccion' in df_filtrado.columns:
-        ventas_ciudad_sat = df_filtrado.groupby(['pais', 'ciudad'])['satisfaccion'].mean().reset_index()
-        ventas_ciudad = ventas_ciudad.merge(ventas_ciudad_sat, on=['pais', 'ciudad'], how='left')
-    
-    # Combinar mapa de burbujas con un mapa coroplético en un gráfico de múltiples capas
-    fig_geo_completo = go.Figure()
-    
-    # Capa 1: Mapa coroplético de países como base
-    for trace in fig_mapa.data:
-        fig_geo_completo.add_trace(trace)
-    
-    # Capa 2: Burbujas para ciudades
-    if not ventas_ciudad.empty:
+
+# Títulos del mapa geográfico según las capas visibles
+TITULOS_MAPA_GEO = {
+    'ambas': 'Análisis Geoespacial de Ventas: Países y Ciudades',
+    'paises': 'Distribución Geográfica de Ventas por País',
+    'ciudades': 'Análisis Geoespacial de Ventas por Ciudad',
+}
+
+
+# Figura del mapa geográfico: países como base y burbujas por ciudad encima, con
+# botones para mostrar una capa, la otra o ambas
+def figura_mapa_geo(metricas_pais, ventas_ciudad, tamano_celda, pais_foco=None):
+    # Capa 1: Mapa coroplético de países como base (se construye una sola vez)
+    fig_geo_completo = figura_mapa_paises(metricas_pais)
+    n_trazas_paises = len(fig_geo_completo.data)
+
+    # Acercar a un país: solo sus ciudades y el encuadre ajustado a ellas
+    if pais_foco is not None:
+        ventas_ciudad = ventas_ciudad[ventas_ciudad['pais'] == pais_foco]
+
+    # Capa 2: Burbujas para ciudades, ubicadas por latitud y longitud. Las
+    # ciudades cercanas se agrupan en una burbuja según el nivel de detalle
+    burbujas = agrupar_ciudades(ventas_ciudad, tamano_celda)
+    if not burbujas.empty:
         # Ajustar tamaño de burbujas para mejor visualización
         size_min = 8
         size_max = 40
-        
-        # Calcular tamaños normalizados para las burbujas
-        if len(ventas_ciudad) > 1:
-            min_cantidad = ventas_ciudad['cantidad'].min()
-            max_cantidad = ventas_ciudad['cantidad'].max()
-            rango = max_cantidad - min_cantidad
-            if rango > 0:
-                normalizer = lambda x: (x - min_cantidad) / rango * (size_max - size_min) + size_min
-                bubble_sizes = [normalizer(val) for val in ventas_ciudad['cantidad']]
-            else:
-                bubble_sizes = [size_max] * len(ventas_ciudad)
-        else:
-            bubble_sizes = [size_max]
-        
+        bubble_sizes = escalar_tamanos(burbujas['cantidad'], size_min, size_max)
+
         fig_geo_completo.add_trace(go.Scattergeo(
-            locationmode='country names',
-            locations=ventas_ciudad['pais'],
-            text=ventas_ciudad['ciudad'],
+            lat=burbujas['lat'],
+            lon=burbujas['lon'],
+            text=burbujas['rotulo'],
+            customdata=burbujas[['pais', 'cantidad', 'n_ciudades']],
             marker=dict(
                 size=bubble_sizes,
-                color=ventas_ciudad['ventas'],
+                color=burbujas['ventas'],
                 colorscale='Viridis',
                 colorbar=dict(
                     title=dict(
@@ -1421,17 +1477,52 @@ def mostrar_analisis_estrategico():
             ),
             mode='markers',
             hovertemplate='<b>%{text}</b><br>' +
-                          'País: %{location}<br>' +
+                          'País: %{customdata[0]}<br>' +
                           'Ventas: $%{marker.color:,.2f}<br>' +
-                          'Cantidad: %{marker.size:,.0f}' +
+                          'Cantidad: %{customdata[1]:,.0f}<br>' +
+                          'Ciudades: %{customdata[2]}' +
                           '<extra></extra>',
             name='Ciudades'
         ))
-    
-    # Ajustes finales para el mapa combinado
+
+    # Selector de capas: cambia la visibilidad de las trazas y el título en el navegador
+    n_trazas_ciudades = len(fig_geo_completo.data) - n_trazas_paises
+    capas = [
+        ('Países y ciudades', 'ambas', True, True),
+        ('Solo países', 'paises', True, False),
+        ('Solo ciudades', 'ciudades', False, True),
+    ]
+    selector_capas = dict(
+        type='buttons',
+        direction='right',
+        buttons=[
+            dict(
+                label=etiqueta,
+                method='update',
+                args=[
+                    {'visible': [con_paises] * n_trazas_paises + [con_ciudades] * n_trazas_ciudades},
+                    {'title.text': TITULOS_MAPA_GEO[clave]}
+                ]
+            )
+            for etiqueta, clave, con_paises, con_ciudades in capas
+        ],
+        active=0,
+        showactive=True,
+        x=0.01,
+        xanchor='left',
+        y=0.99,
+        yanchor='top',
+        pad=dict(r=4, t=4),
+        bgcolor='white',
+        bordercolor='#4a86e8',
+        font=dict(size=12, color='#1a365d')
+    )
+
+    # Ajustes finales para el mapa combinado (sin ciudades no hay capas que alternar)
     fig_geo_completo.update_layout(
+        updatemenus=[selector_capas] if n_trazas_ciudades else [],
         title={
-            'text': 'Análisis Geoespacial de Ventas: Países y Ciudades',
+            'text': TITULOS_MAPA_GEO['ambas' if n_trazas_ciudades else 'paises'],
             'y': 0.95,
             'x': 0.5,
             'xanchor': 'center',
@@ -1452,6 +1543,7 @@ def mostrar_analisis_estrategico():
             lonaxis=dict(range=[-150, 70]),
             lataxis=dict(range=[-55, 85]),
             projection_scale=1.0,
+            resolution=RESOLUCION_MAPAS,
         ),
         height=650,
         width=950,
@@ -1459,11 +1551,24 @@ def mostrar_analisis_estrategico():
         dragmode='pan',
         margin=dict(l=0, r=110, t=80, b=0)
     )
+
+    # Encuadre del país elegido: sus ciudades con un margen alrededor
+    if pais_foco is not None and not burbujas.empty:
+        margen = 6
+        fig_geo_completo.update_geos(
+            lonaxis_range=[burbujas['lon'].min() - margen, burbujas['lon'].max() + margen],
+            lataxis_range=[burbujas['lat'].min() - margen, burbujas['lat'].max() + margen]
+        )
     
-    st.plotly_chart(fig_geo_completo, use_container_width=True)
+    return fig_geo_completo
+
+
+@st.fragment
+def mostrar_mapa_ciudades(seleccion):
+    # 6. Ciudades: las burbujas son una capa del mapa geográfico de la sección anterior
+    ventas_ciudad = calcular_ciudades(seleccion)
     
     # Insight para el mapa combinado de países y ciudades
-   
     if not ventas_ciudad.empty:
         ciudad_mas_ventas = ventas_ciudad.loc[ventas_ciudad['ventas'].idxmax()]
         
@@ -1509,165 +1614,170 @@ def mostrar_analisis_estrategico():
     else:
         st.info("No hay datos suficientes de ciudades para generar insights geoespaciales detallados.")
 
+
+# Figura de ventas por segmento de edad y género
+def figura_segmentacion(segmentacion):
+    # Ordenar los datos para un mejor aspecto visual
+    orden_edad = ['<30', '30-45', '>45'] # Mantener orden lógico de grupos etarios
+
+    # Crear un gráfico de barras agrupadas más profesional
+    fig_segmentacion = px.bar(
+        segmentacion,
+        x='rango_edad',
+        y='ventas',
+        color='genero_cliente',
+        color_discrete_map={  # Paleta de colores personalizada más profesional
+            'femenino': '#4a86e8',
+            'masculino': '#ff7043',
+            'f': '#4a86e8',
+            'm': '#ff7043',
+            'female': '#4a86e8',
+            'male': '#ff7043',
+            # Valores adicionales para posibles variaciones en los datos
+            'mujer': '#4a86e8', 
+            'hombre': '#ff7043'
+        },
+        category_orders={"rango_edad": orden_edad},
+        labels={
+            'ventas': 'Ventas Totales (USD)',
+            'rango_edad': 'Segmento de Edad',
+            'genero_cliente': 'Género',
+            'porcentaje': 'Participación'
+        },
+        text='porcentaje',  # Mostrar porcentajes en las barras
+        height=550,
+        custom_data=['porcentaje', 'genero_cliente']  # Incluye género para el hover
+    )
+
+    # Personalizar el diseño con un estilo más profesional
+    # CORRECCIÓN: yanchor cambiado de 'center' a 'middle' para evitar ValueError en Plotly
+    fig_segmentacion.update_layout(
+        title={
+            'text': 'Segmentación de Ventas por Edad y Género',
+            'y': 0.97,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': TITLE_FONT
+        },
+        barmode='group',
+        bargap=0.3,  # Espacio entre grupos
+        bargroupgap=0.1,  # Espacio entre barras del mismo grupo
+        xaxis_title={
+            'text': '<b>Segmento de Edad</b>',
+            'font': AXIS_TITLE_FONT
+        },
+        yaxis_title={
+            'text': '<b>Ventas Totales (USD)</b>',
+            'font': AXIS_TITLE_FONT
+        },
+        legend_title={
+            'text': '<b>Género</b>',
+            'font': LEGEND_FONT
+        },
+        font=LABEL_FONT,
+        plot_bgcolor='rgba(240,249,255,0.95)',
+        hoverlabel=dict(
+            bgcolor="white", 
+            font_size=14, 
+            font_family="Arial",
+            bordercolor='rgba(0,0,0,0.1)'
+        ),
+        legend=dict(
+            orientation="v",
+            yanchor="middle",
+            y=0.5,
+            xanchor="left",
+            x=1.25,
+            bgcolor='rgba(255,255,255,0.8)',
+            bordercolor='rgba(200,210,220,0.5)',
+            borderwidth=1
+        ),
+        margin=dict(l=60, r=320, t=80, b=120),  # Margen inferior aumentado para evitar solapamiento
+        annotations=[
+            dict(
+                text="Fuente: Datos de ventas TechNova Retail",
+                showarrow=False,
+                xref="paper",
+                yref="paper",
+                x=1,
+                y=-0.2,
+                font=dict(size=10, color="#6c757d"),
+                align="right"
+            )
+        ]
+    )
+
+    # Mejorar el formato de las barras
+    fig_segmentacion.update_traces(
+        texttemplate='%{customdata[0]}%',  # Mostrar porcentaje
+        textposition='outside',
+        textfont=dict(
+            size=13,
+            color='#1a365d',
+            family='Arial',
+            weight='bold'
+        )
+    )
+
+    # Añadir línea con promedio general
+    promedio_ventas = segmentacion['ventas'].mean()
+    fig_segmentacion.add_shape(
+        type="line",
+        x0=-0.5,
+        y0=promedio_ventas,
+        x1=len(orden_edad) - 0.5,
+        y1=promedio_ventas,
+        line=dict(
+            color="#2c5282",
+            width=2,
+            dash="dash",
+        ),
+        opacity=0.7
+    )
+
+    # Etiqueta para la línea de promedio
+    fig_segmentacion.add_annotation(
+        x=len(orden_edad) - 0.5,
+        y=promedio_ventas,
+        text=f"Ventas promedio: ${promedio_ventas:,.0f}",
+        showarrow=True,
+        arrowhead=2,
+        arrowsize=1,
+        arrowwidth=2,
+        arrowcolor="#2c5282",
+        ax=70,
+        ay=0,
+        font=dict(
+            size=12,
+            color="#2c5282",
+            family="Arial",
+            weight="bold"
+        ),
+        bgcolor="white",
+        opacity=0.9,
+        bordercolor="#4a86e8",
+        borderwidth=1.5,
+        borderpad=4
+    )
+
+    return fig_segmentacion
+
+
+@st.fragment
+def mostrar_segmentacion(seleccion):
     # 7. Segmentación de mercado mejorada: Visualización interactiva
     st.markdown("<h2 style='text-align:center; color:#1a365d; margin-bottom:20px; margin-top:40px; font-weight:700; font-size:28px; font-family:Arial, sans-serif;'>Segmentación de Mercado</h2>", unsafe_allow_html=True)
     
     # Añadimos el código para una sección básica de segmentación de mercado
-    if 'rango_edad' in df_filtrado.columns and 'genero_cliente' in df_filtrado.columns:
-        # Preparar datos para el gráfico de segmentación
-        segmentacion = df_filtrado.groupby(['rango_edad', 'genero_cliente'])['ventas'].sum().reset_index()
+    columnas = obtener_motor_filtros().df.columns
+    if 'rango_edad' in columnas and 'genero_cliente' in columnas:
+        # Preparar datos para el gráfico de segmentación (con porcentajes por segmento)
+        datos_segmentacion = calcular_segmentacion(seleccion)
+        segmentacion = datos_segmentacion["segmentacion"]
         
         if not segmentacion.empty:
-            # Calcular porcentajes para cada segmento
-            total_ventas = segmentacion['ventas'].sum()
-            segmentacion['porcentaje'] = (segmentacion['ventas'] / total_ventas * 100).round(1)
-            
-            # Ordenar los datos para un mejor aspecto visual
-            orden_edad = ['<30', '30-45', '>45'] # Mantener orden lógico de grupos etarios
-            
-            # Crear un gráfico de barras agrupadas más profesional
-            fig_segmentacion = px.bar(
-                segmentacion,
-                x='rango_edad',
-                y='ventas',
-                color='genero_cliente',
-                color_discrete_map={  # Paleta de colores personalizada más profesional
-                    'femenino': '#4a86e8',
-                    'masculino': '#ff7043',
-                    'f': '#4a86e8',
-                    'm': '#ff7043',
-                    'female': '#4a86e8',
-                    'male': '#ff7043',
-                    # Valores adicionales para posibles variaciones en los datos
-                    'mujer': '#4a86e8', 
-                    'hombre': '#ff7043'
-                },
-                category_orders={"rango_edad": orden_edad},
-                labels={
-                    'ventas': 'Ventas Totales (USD)',
-                    'rango_edad': 'Segmento de Edad',
-                    'genero_cliente': 'Género',
-                    'porcentaje': 'Participación'
-                },
-                text='porcentaje',  # Mostrar porcentajes en las barras
-                height=550,
-                custom_data=['porcentaje', 'genero_cliente']  # Incluye género para el hover
-            )
-            
-            # Personalizar el diseño con un estilo más profesional
-            # CORRECCIÓN: yanchor cambiado de 'center' a 'middle' para evitar ValueError en Plotly
-            fig_segmentacion.update_layout(
-                title={
-                    'text': 'Segmentación de Ventas por Edad y Género',
-                    'y': 0.97,
-                    'x': 0.5,
-                    'xanchor': 'center',
-                    'yanchor': 'top',
-                    'font': TITLE_FONT
-                },
-                barmode='group',
-                bargap=0.3,  # Espacio entre grupos
-                bargroupgap=0.1,  # Espacio entre barras del mismo grupo
-                xaxis_title={
-                    'text': '<b>Segmento de Edad</b>',
-                    'font': AXIS_TITLE_FONT
-                },
-                yaxis_title={
-                    'text': '<b>Ventas Totales (USD)</b>',
-                    'font': AXIS_TITLE_FONT
-                },
-                legend_title={
-                    'text': '<b>Género</b>',
-                    'font': LEGEND_FONT
-                },
-                font=LABEL_FONT,
-                plot_bgcolor='rgba(240,249,255,0.95)',
-                hoverlabel=dict(
-                    bgcolor="white", 
-                    font_size=14, 
-                    font_family="Arial",
-                    bordercolor='rgba(0,0,0,0.1)'
-                ),
-                legend=dict(
-                    orientation="v",
-                    yanchor="middle",
-                    y=0.5,
-                    xanchor="left",
-                    x=1.25,
-                    bgcolor='rgba(255,255,255,0.8)',
-                    bordercolor='rgba(200,210,220,0.5)',
-                    borderwidth=1
-                ),
-                margin=dict(l=60, r=320, t=80, b=120),  # Margen inferior aumentado para evitar solapamiento
-                annotations=[
-                    dict(
-                        text="Fuente: Datos de ventas TechNova Retail",
-                        showarrow=False,
-                        xref="paper",
-                        yref="paper",
-                        x=1,
-                        y=-0.2,
-                        font=dict(size=10, color="#6c757d"),
-                        align="right"
-                    )
-                ]
-            )
-            
-            # Mejorar el formato de las barras
-            fig_segmentacion.update_traces(
-                texttemplate='%{customdata[0]}%',  # Mostrar porcentaje
-                textposition='outside',
-                textfont=dict(
-                    size=13,
-                    color='#1a365d',
-                    family='Arial',
-                    weight='bold'
-                )
-            )
-            
-            # Añadir línea con promedio general
-            promedio_ventas = segmentacion['ventas'].mean()
-            fig_segmentacion.add_shape(
-                type="line",
-                x0=-0.5,
-                y0=promedio_ventas,
-                x1=len(orden_edad) - 0.5,
-                y1=promedio_ventas,
-                line=dict(
-                    color="#2c5282",
-                    width=2,
-                    dash="dash",
-                ),
-                opacity=0.7
-            )
-            
-            # Etiqueta para la línea de promedio
-            fig_segmentacion.add_annotation(
-                x=len(orden_edad) - 0.5,
-                y=promedio_ventas,
-                text=f"Ventas promedio: ${promedio_ventas:,.0f}",
-                showarrow=True,
-                arrowhead=2,
-                arrowsize=1,
-                arrowwidth=2,
-                arrowcolor="#2c5282",
-                ax=70,
-                ay=0,
-                font=dict(
-                    size=12,
-                    color="#2c5282",
-                    family="Arial",
-                    weight="bold"
-                ),
-                bgcolor="white",
-                opacity=0.9,
-                bordercolor="#4a86e8",
-                borderwidth=1.5,
-                borderpad=4
-            )
-            
-            # Mostrar el gráfico
-            st.plotly_chart(fig_segmentacion, use_container_width=True)
+            mostrar_figura_cacheada("segmentacion", figura_segmentacion, segmentacion)
             
             # Identificar el segmento más valioso y hacer cálculos adicionales
             segmento_mas_valioso = segmentacion.loc[segmentacion['ventas'].idxmax()]
@@ -1678,14 +1788,9 @@ def mostrar_analisis_estrategico():
                 diferencia_valor = segmento_mas_valioso['ventas'] - segmento_opuesto['ventas'].values[0]
                 diferencia_porcentaje = (diferencia_valor / segmento_opuesto['ventas'].values[0]) * 100
                 
-                # Cálculo de ticket promedio por segmento si es posible
-                if 'id_cliente' in df_filtrado.columns:
-                    ticket_por_segmento = df_filtrado.groupby(['rango_edad', 'genero_cliente']).agg({
-                        'ventas': 'sum',
-                        'id_cliente': 'nunique'
-                    })
-                    ticket_por_segmento['ticket_promedio'] = ticket_por_segmento['ventas'] / ticket_por_segmento['id_cliente']
-                    
+                # Ticket promedio por segmento si es posible
+                ticket_por_segmento = datos_segmentacion["ticket_por_segmento"]
+                if ticket_por_segmento is not None:
                     ticket_segmento_valioso = ticket_por_segmento.loc[(segmento_mas_valioso['rango_edad'], segmento_mas_valioso['genero_cliente']), 'ticket_promedio']
                     ticket_info = f"<p>El ticket promedio de este segmento es <b>${ticket_segmento_valioso:.2f}</b>, lo que indica un alto poder adquisitivo.</p>"
                 else:
@@ -1703,11 +1808,8 @@ def mostrar_analisis_estrategico():
                 genero_texto = "masculino" if segmento_mas_valioso['genero_cliente'].lower() in ['masculino', 'm', 'male', 'hombre'] else "femenino"
                 genero_opuesto = "femenino" if genero_texto == "masculino" else "masculino"
                 
-                # Análisis de categorías preferidas por este segmento
-                categorias_segmento = df_filtrado[
-                    (df_filtrado['rango_edad'] == segmento_mas_valioso['rango_edad']) & 
-                    (df_filtrado['genero_cliente'] == segmento_mas_valioso['genero_cliente'])
-                ].groupby('categoria')['ventas'].sum().sort_values(ascending=False)
+                # Categorías preferidas por este segmento
+                categorias_segmento = datos_segmentacion["categorias_segmento"]
                 
                 if not categorias_segmento.empty:
                     top_categorias = categorias_segmento.head(2).index.tolist()
@@ -1757,6 +1859,7 @@ def mostrar_analisis_estrategico():
     else:
         st.info("No hay datos suficientes para la segmentación de mercado por edad y género.")
 
+
 # Función para crear tarjetas de métricas bonitas
 def metric_card(title, value, delta, icon, color):
     st.markdown(f"""
@@ -0,0 +1,100 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+# Límites de la caché de cálculos por sección del análisis estratégico
+MAX_ENTRADAS_SECCIONES = 256
+TTL_SECCIONES_SEGUNDOS = 30 * 60
+PRESUPUESTO_SECCIONES_BYTES = 128 * 1024 * 1024
+
+
+# Estimación del tamaño en memoria de un resultado cacheado
+def tamano_aproximado(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series, pd.Index)):
+        uso = valor.memory_usage(deep=True)
+        return int(uso.sum()) if hasattr(uso, "sum") else int(uso)
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamano_aproximado(k) + tamano_aproximado(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set)):
+        return sys.getsizeof(valor) + sum(tamano_aproximado(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+# Caché LRU acotada por número de entradas, antigüedad (TTL) y bytes totales.
+# Es compartida por todas las sesiones del proceso, así que usa un lock
+class CacheLRU:
+    def __init__(self, max_entradas, ttl_segundos, presupuesto_bytes):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.presupuesto_bytes = presupuesto_bytes
+        self._entradas = OrderedDict()  # clave -> (valor, bytes, instante)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _quitar(self, clave):
+        _, tamano, _ = self._entradas.pop(clave)
+        self._bytes -= tamano
+
+    # Devuelve (encontrado, valor) y marca la entrada como usada recientemente
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return False, None
+            valor, _, instante = entrada
+            if time.monotonic() - instante > self.ttl_segundos:
+                self._quitar(clave)
+                return False, None
+            self._entradas.move_to_end(clave)
+            return True, valor
+
+    def guardar(self, clave, valor, tamano=None):
+        if tamano is None:
+            tamano = tamano_aproximado(valor)
+        # Un resultado que no cabe en el presupuesto no se cachea
+        if tamano > self.presupuesto_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (valor, tamano, time.monotonic())
+            self._bytes += tamano
+            # Desalojar las entradas menos usadas hasta respetar los límites
+            while len(self._entradas) > self.max_entradas or self._bytes > self.presupuesto_bytes:
+                self._quitar(next(iter(self._entradas)))
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+cache_secciones = CacheLRU(MAX_ENTRADAS_SECCIONES, TTL_SECCIONES_SEGUNDOS, PRESUPUESTO_SECCIONES_BYTES)
+
+
+# Memoiza el cálculo de una sección sobre la clave normalizada de los filtros
+# (países y categorías ordenados + rango de fechas). Los argumentos extra también
+# forman parte de la clave. El resultado se comparte entre sesiones: no mutarlo
+def memoizar_por_filtros(seccion, cache=cache_secciones):
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(seleccion, *args):
+            clave = (seccion, seleccion.clave) + args
+            encontrado, valor = cache.obtener(clave)
+            if encontrado:
+                return valor
+            valor = funcion(seleccion, *args)
+            cache.guardar(clave, valor)
+            return valor
+        return envoltura
+    return decorador
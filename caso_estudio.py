@@ -1,67 +1,7 @@
 import streamlit as st
 
 def mostrar_caso_estudio():
-    # Estilo CSS para estandarizar la apariencia similar a analisis_estrategico.py
-    CASE_STUDY_STYLE = """
-    <style>
-    body {
-        font-family: Arial, sans-serif;
-        color: #2d3748;
-    }
-    h1 {
-        color: #1a365d;
-        font-weight: 700;
-        font-size: 28px;
-        font-family: Arial, sans-serif;
-        margin-bottom: 20px;
-    }
-    h2 {
-        color: #1a365d;
-        font-weight: 700;
-        font-size: 24px;
-        font-family: Arial, sans-serif;
-        margin-top: 30px;
-        margin-bottom: 15px;
-    }
-    h3 {
-        color: #2c5282;
-        font-weight: 700;
-        font-size: 20px;
-        font-family: Arial, sans-serif;
-        margin-top: 20px;
-        margin-bottom: 10px;
-    }
-    p, li {
-        color: #2d3748;
-        font-size: 16px;
-        line-height: 1.6;
-        font-family: Arial, sans-serif;
-        margin-bottom: 15px;
-    }
-    b {
-        font-weight: 700;
-    }
-    .card {
-        font-family: Arial, sans-serif;
-        background-color: #f8fafc;
-        padding: 20px;
-        border-radius: 10px;
-        border-left: 5px solid #4a86e8;
-        margin-bottom: 20px;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-    }
-    .expander-header {
-        color: #1a365d;
-        font-weight: 700;
-        font-size: 18px;
-        font-family: Arial, sans-serif;
-    }
-    </style>
-    """
-    
-    # Inyectar estilos CSS
-    st.markdown(CASE_STUDY_STYLE, unsafe_allow_html=True)
-
+    # Los estilos de esta vista están en static/estilos.css (.st-key-caso_estudio)
     st.markdown("<h1>Taller práctico: Analizando los datos en mapas</h1>", unsafe_allow_html=True)
     
     # Introducción
@@ -0,0 +1,52 @@
+import streamlit as st
+import pandas as pd
+
+from filtros import MotorFiltros, obtener_motor_filtros
+
+# Grano del cubo: día × país × ciudad × categoría × método de pago × rango de
+# edad × género. mes_ano depende funcionalmente del día, así que viaja como
+# dimensión extra sin aumentar el número de celdas
+DIMENSIONES_CUBO = [
+    "fecha", "mes_ano", "pais", "ciudad", "categoria",
+    "metodo_pago", "rango_edad", "genero_cliente"
+]
+
+# Medidas aditivas: se pueden sumar entre celdas sin perder exactitud
+MEDIDAS_CUBO = ["ventas", "cantidad", "transacciones", "satisfaccion_suma", "satisfaccion_n"]
+
+
+# Agrega la tabla de transacciones al grano del cubo. "fecha" pasa a ser el día
+# (sin hora) para que el cubo se pueda filtrar con el mismo MotorFiltros
+def construir_cubo(df):
+    if df.empty:
+        return pd.DataFrame(columns=DIMENSIONES_CUBO + MEDIDAS_CUBO)
+
+    base = df.assign(
+        fecha=df["fecha"].dt.normalize(),
+        # La cantidad llega como int32 compacto: se suma en int64 para no desbordar
+        cantidad=df["cantidad"].astype("int64"),
+        satisfaccion_n=df["satisfaccion"].notna().astype("int64")
+    )
+    cubo = base.groupby(DIMENSIONES_CUBO, observed=True, dropna=False).agg(
+        ventas=("ventas", "sum"),
+        cantidad=("cantidad", "sum"),
+        transacciones=("ventas", "size"),
+        satisfaccion_suma=("satisfaccion", "sum"),
+        satisfaccion_n=("satisfaccion_n", "sum"),
+    ).reset_index()
+    return cubo.sort_values("fecha", kind="stable", ignore_index=True)
+
+
+# Enrolla el cubo (ya filtrado) a las claves pedidas. Devuelve las medidas
+# aditivas sumadas más la satisfacción promedio reconstruida como suma / n.
+# observed=False rellena con ceros las combinaciones de categorías sin ventas
+def enrollar(cubo, claves, observed=True):
+    resultado = cubo.groupby(claves, observed=observed)[MEDIDAS_CUBO].sum()
+    resultado["satisfaccion"] = resultado["satisfaccion_suma"] / resultado["satisfaccion_n"]
+    return resultado.reset_index()
+
+
+# El cubo se construye una vez por proceso y se filtra con sus propios índices
+@st.cache_resource
+def obtener_motor_cubo():
+    return MotorFiltros(construir_cubo(obtener_motor_filtros().df))
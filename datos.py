@@ -0,0 +1,512 @@
+import streamlit as st
+import pandas as pd
+import unicodedata
+import numpy as np
+import hashlib
+import logging
+import os
+import sys
+from pandas.api.types import union_categoricals
+
+# Ruta del libro de ventas que alimenta toda la aplicación. Está fuera de static/
+# a propósito: todo lo que hay en static/ se publica en /app/static
+RUTA_EXCEL = "recursos/Ventas_Minoristas.xlsx"
+
+# Caché columnar de la tabla limpia. Se invalida sola cuando cambia el Excel
+# (hash de contenido + mtime) o cuando cambia VERSION_LIMPIEZA
+DIRECTORIO_CACHE = ".cache_datos"
+VERSION_LIMPIEZA = 6
+
+logger = logging.getLogger(__name__)
+
+# Poner EA4_RECONSTRUIR_CACHE=1 en el entorno para forzar un re-parseo del Excel
+RECONSTRUIR_CACHE = os.environ.get("EA4_RECONSTRUIR_CACHE", "") not in ("", "0")
+
+# Modo de lectura del Excel: "completo" usa pd.read_excel, "streaming" recorre
+# el libro por bloques con openpyxl en modo solo lectura y "auto" elige
+# streaming cuando el archivo supera UMBRAL_STREAMING_BYTES
+MODO_LECTURA = os.environ.get("EA4_MODO_LECTURA", "auto")
+UMBRAL_STREAMING_BYTES = 20 * 1024 * 1024
+TAMANO_BLOQUE = 50_000
+
+# Renombrar columnas para quitar espacios y caracteres especiales
+RENOMBRAR_COLUMNAS = {
+    "ID_cliente": "id_cliente",
+    "Nombre_producto": "nombre_producto",
+    "Cantidad": "cantidad",
+    "Precio_unitario(USD)": "precio_unitario_usd",
+    "Fecha": "fecha",
+    "categoria": "categoria",
+    "pais": "pais",
+    "ciudad": "ciudad",
+    "metodo_pago": "metodo_pago",
+    "edad_cliente": "edad_cliente",
+    "genero_cliente": "genero_cliente",
+    "calificación_satisfaccion": "satisfaccion"
+}
+
+# Columnas de texto que se limpian con limpiar_texto
+COLUMNAS_TEXTO = ["categoria", "ciudad", "metodo_pago", "genero_cliente", "nombre_producto"]
+
+# Columnas de baja cardinalidad que se guardan como Categorical
+COLUMNAS_CATEGORICAS = ["pais", "pais_iso3", "ciudad", "categoria", "metodo_pago", "genero_cliente", "nombre_producto"]
+
+# Tipo entero compacto para cada columna numérica que lo admite. Precio y ventas
+# se quedan en float64 para que los totales monetarios no pierdan precisión
+TIPOS_ENTEROS = {
+    "id_cliente": "int32",
+    "cantidad": "int32",
+    "edad_cliente": "int16",
+    "satisfaccion": "int8",
+}
+
+# Segmentación por edad usada en varios gráficos
+BINS_EDAD = [0, 30, 45, 100]
+ETIQUETAS_EDAD = ['<30', '30-45', '>45']
+
+DIAS_SEMANA = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+
+# Columnas sin las cuales una fila no sirve para el análisis
+COLUMNAS_CRITICAS = ["cantidad", "precio_unitario_usd", "ventas", "categoria", "fecha"]
+
+
+# Limpiar strings: minúsculas, sin tildes, sin espacios extras
+def limpiar_texto(x):
+    if isinstance(x, str):
+        x = x.strip().lower()
+        # Solo quitamos tildes y caracteres especiales para la mayoría de los campos
+        x = unicodedata.normalize('NFKD', x).encode('ascii', errors='ignore').decode('utf-8')
+        return x
+    return x
+
+
+# Diccionario de mapeo para países comunes que pueden tener problemas con los
+# mapas. Se construye una sola vez al importar el módulo
+MAPEO_PAISES = {
+    'espana': 'Spain',
+    'españa': 'Spain',
+    'espa\xf1a': 'Spain',
+    'espanya': 'Spain',
+    'spain': 'Spain',
+    'mexico': 'Mexico',
+    'méxico': 'Mexico',
+    'peru': 'Peru',
+    'perú': 'Peru',
+    'argentina': 'Argentina',
+    'chile': 'Chile',
+    'colombia': 'Colombia',
+    'venezuela': 'Venezuela',
+    'brasil': 'Brazil',
+    'brazil': 'Brazil'
+}
+
+
+# Función especial de mapeo para países para asegurar compatibilidad con los mapas
+def normalizar_pais(nombre_pais):
+    if not isinstance(nombre_pais, str):
+        return nombre_pais
+
+    nombre_pais = nombre_pais.strip().lower()
+
+    # Devolver el nombre de país normalizado si existe en el mapeo
+    return MAPEO_PAISES.get(nombre_pais, nombre_pais.title())
+
+
+# Código ISO 3166-1 alfa-3 de cada país, indexado por el nombre ya pasado por
+# limpiar_texto (minúsculas y sin tildes) para cubrir las variantes de escritura
+# en español e inglés. Los mapas se dibujan con estos códigos y Plotly no tiene
+# que emparejar nombres
+CODIGOS_ISO3 = {
+    'espana': 'ESP',
+    'espanya': 'ESP',
+    'spain': 'ESP',
+    'mexico': 'MEX',
+    'peru': 'PER',
+    'argentina': 'ARG',
+    'chile': 'CHL',
+    'colombia': 'COL',
+    'venezuela': 'VEN',
+    'brasil': 'BRA',
+    'brazil': 'BRA',
+    'ecuador': 'ECU',
+    'uruguay': 'URY',
+    'paraguay': 'PRY',
+    'bolivia': 'BOL',
+    'costa rica': 'CRI',
+    'panama': 'PAN',
+    'guatemala': 'GTM',
+    'honduras': 'HND',
+    'el salvador': 'SLV',
+    'nicaragua': 'NIC',
+    'cuba': 'CUB',
+    'republica dominicana': 'DOM',
+    'dominican republic': 'DOM',
+    'puerto rico': 'PRI',
+    'portugal': 'PRT',
+    'estados unidos': 'USA',
+    'united states': 'USA',
+    'eeuu': 'USA',
+    'ee.uu.': 'USA',
+    'usa': 'USA',
+    'canada': 'CAN',
+    'francia': 'FRA',
+    'france': 'FRA',
+    'italia': 'ITA',
+    'italy': 'ITA',
+    'alemania': 'DEU',
+    'germany': 'DEU',
+    'reino unido': 'GBR',
+    'united kingdom': 'GBR',
+}
+
+
+# Código ISO-3 de un país o None si no está en CODIGOS_ISO3
+def codigo_iso3(nombre_pais):
+    if not isinstance(nombre_pais, str):
+        return None
+    return CODIGOS_ISO3.get(limpiar_texto(nombre_pais))
+
+
+# Aplica `funcion` una vez por valor distinto de la serie y reparte el resultado
+# a todas las filas con los códigos de factorize. Estas columnas tienen muy pocos
+# valores distintos, así que el coste depende de la cardinalidad y no de las filas
+def normalizar_por_valor_unico(serie, funcion):
+    codigos, unicos = pd.factorize(serie)
+    normalizados = np.array([funcion(valor) for valor in unicos] + [None], dtype=object)
+    resultado = pd.Series(normalizados[codigos], index=serie.index, name=serie.name)
+    # Los faltantes (código -1) conservan su valor original
+    return resultado.where(codigos != -1, serie)
+
+
+# Aplica toda la limpieza sobre el DataFrame crudo leído del Excel
+def limpiar_datos(df):
+    df = df.rename(columns=RENOMBRAR_COLUMNAS)
+
+    # Aplicar limpieza a columnas de texto comunes
+    for col in COLUMNAS_TEXTO:
+        if col in df.columns:
+            df[col] = normalizar_por_valor_unico(df[col], limpiar_texto)
+
+    # Aplicar la normalización especial para países
+    if "pais" in df.columns:
+        df["pais"] = normalizar_por_valor_unico(df["pais"], normalizar_pais)
+        df["pais_iso3"] = normalizar_por_valor_unico(df["pais"], codigo_iso3)
+
+    # Corregir tipos numéricos
+    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce")
+    df["precio_unitario_usd"] = pd.to_numeric(df["precio_unitario_usd"], errors="coerce")
+    df["edad_cliente"] = pd.to_numeric(df["edad_cliente"], errors="coerce")
+    # Las fechas inválidas quedan en NaT y se descartan con los faltantes críticos
+    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
+
+    # Procesar la columna de satisfacción
+    if "satisfaccion" in df.columns:
+        df["satisfaccion"] = pd.to_numeric(df["satisfaccion"], errors="coerce")
+    else:
+        # Si la columna no existe, buscarla silenciosamente con otros nombres posibles
+        for col in df.columns:
+            if "satisfac" in col.lower():
+                df = df.rename(columns={col: "satisfaccion"})
+                df["satisfaccion"] = pd.to_numeric(df["satisfaccion"], errors="coerce")
+                break
+        else:
+            # Si no se encuentra, usar valor neutral sin mostrar advertencia
+            df["satisfaccion"] = 3.0  # Valor neutral por defecto
+
+    # Crear columna de ventas
+    df["ventas"] = df["cantidad"] * df["precio_unitario_usd"]
+
+    # Quitar filas con datos faltantes críticos
+    df = df.dropna(subset=COLUMNAS_CRITICAS)
+
+    # Filtrar ventas no positivas
+    df = df[df["ventas"] > 0]
+
+    return df
+
+
+# Convierte una columna numérica al entero compacto indicado solo si no pierde
+# información: sin faltantes, valores enteros y dentro del rango del tipo
+def _entero_compacto(serie, tipo):
+    if serie.isna().any():
+        return serie
+    valores = serie.to_numpy()
+    info = np.iinfo(tipo)
+    if valores.size and (valores.min() < info.min or valores.max() > info.max):
+        return serie
+    if not np.array_equal(valores, np.round(valores)):
+        return serie
+    return serie.astype(tipo)
+
+
+# Valores de una columna limpia con su tipo compacto: Categorical con las
+# categorías ordenadas alfabéticamente (orden estable entre cargas) para el texto
+# y el entero más chico que la admita para los números
+def _valores_compactos(col, serie):
+    if col in COLUMNAS_CATEGORICAS:
+        return pd.Categorical(serie, categories=sorted(serie.dropna().unique()))
+    if col in TIPOS_ENTEROS and pd.api.types.is_numeric_dtype(serie):
+        serie = _entero_compacto(serie, TIPOS_ENTEROS[col])
+    return serie.to_numpy()
+
+
+# Emite las columnas de texto como Categorical y reduce los enteros. La tabla
+# nueva se arma columna por columna sin copiar las que no cambian de tipo
+def compactar_tipos(df):
+    return pd.DataFrame({col: _valores_compactos(col, df[col]) for col in df.columns}, copy=False)
+
+
+# Etiqueta cada fila con un periodo ya calculado como entero (p. ej. meses desde
+# el epoch). Las etiquetas de texto solo se generan una vez por periodo distinto
+def _categorica_por_periodo(periodos, etiquetar):
+    codigos, unicos = pd.factorize(periodos, sort=True)
+    return pd.Categorical.from_codes(codigos, categories=etiquetar(unicos), ordered=True)
+
+
+# Mes-año ('2024-03') para análisis temporales, con aritmética de periodos de numpy
+def _mes_ano(df):
+    meses = df["fecha"].to_numpy().astype("datetime64[M]")
+    return _categorica_por_periodo(meses, lambda unicos: np.datetime_as_string(unicos, unit="M"))
+
+
+# Trimestre ('2024-T1')
+def _trimestre(df):
+    meses = df["fecha"].to_numpy().astype("datetime64[M]").astype("int64")
+    trimestres = meses // 3
+    return _categorica_por_periodo(
+        trimestres,
+        lambda unicos: [f"{1970 + t // 4}-T{t % 4 + 1}" for t in unicos]
+    )
+
+
+def _ano(df):
+    return df["fecha"].dt.year.astype("int16")
+
+
+def _dia_semana(df):
+    return pd.Categorical.from_codes(df["fecha"].dt.dayofweek, categories=DIAS_SEMANA, ordered=True)
+
+
+def _rango_edad(df):
+    return pd.cut(df["edad_cliente"], bins=BINS_EDAD, labels=ETIQUETAS_EDAD)
+
+
+# Registro de columnas derivadas. Se calculan una sola vez en la etapa cacheada
+# (y quedan guardadas en el parquet), así los reruns de Streamlit solo las leen
+COLUMNAS_DERIVADAS = {
+    "mes_ano": _mes_ano,
+    "trimestre": _trimestre,
+    "ano": _ano,
+    "dia_semana": _dia_semana,
+    "rango_edad": _rango_edad,
+}
+
+
+# Agrega las columnas a la misma tabla, sin copiarla
+def agregar_columnas_derivadas(df):
+    for nombre, calcular in COLUMNAS_DERIVADAS.items():
+        df[nombre] = calcular(df)
+    return df
+
+
+# Memoria por columna antes y después de compactar_tipos. "antes" reconstruye la
+# representación original (texto como object, números en 64 bits)
+def reporte_memoria(df):
+    original = df.copy()
+    for col in original.columns:
+        if isinstance(original[col].dtype, pd.CategoricalDtype):
+            original[col] = original[col].astype(object)
+        elif pd.api.types.is_integer_dtype(original[col]):
+            original[col] = original[col].astype("int64")
+        elif pd.api.types.is_float_dtype(original[col]):
+            original[col] = original[col].astype("float64")
+    reporte = pd.DataFrame({
+        "antes": original.memory_usage(deep=True, index=False),
+        "despues": df.memory_usage(deep=True, index=False),
+        "tipo": df.dtypes.astype(str),
+    })
+    reporte.loc["TOTAL", ["antes", "despues"]] = reporte[["antes", "despues"]].sum()
+    reporte["ahorro_pct"] = (1 - reporte["despues"] / reporte["antes"]) * 100
+    return reporte
+
+
+# Une los bloques compactos de una columna. Cada bloque solo tiene como
+# categorías los valores que vio, así que se unen y se vuelven a ordenar
+def _unir_bloques(partes):
+    if isinstance(partes[0], pd.Categorical):
+        return union_categoricals(partes, sort_categories=True)
+    return np.concatenate(partes)
+
+
+# Lectura en streaming para libros muy grandes: las filas se leen con el
+# iterador de solo lectura de openpyxl, se limpian por bloques de tamaño fijo y
+# cada bloque se guarda ya con los tipos compactos. El pico de memoria queda
+# cerca de dos veces la tabla final compacta más un bloque, en lugar de varias
+# veces el libro
+def leer_excel_streaming(ruta=RUTA_EXCEL, tamano_bloque=TAMANO_BLOQUE):
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        # La primera hoja, igual que pd.read_excel en el modo completo
+        hoja = libro.worksheets[0]
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            raise ValueError(f"La primera hoja de {ruta} está vacía: no tiene encabezado ni filas")
+        encabezado = [str(c) if c is not None else f"columna_{i}" for i, c in enumerate(encabezado)]
+
+        buffers = {}
+        bloque = []
+
+        def volcar_bloque():
+            limpio = limpiar_datos(pd.DataFrame(bloque, columns=encabezado))
+            bloque.clear()
+            for col in limpio.columns:
+                buffers.setdefault(col, []).append(_valores_compactos(col, limpio[col]))
+
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= tamano_bloque:
+                volcar_bloque()
+        if bloque or not buffers:
+            volcar_bloque()
+    finally:
+        libro.close()
+
+    # Cada columna suelta sus bloques apenas se une
+    return pd.DataFrame({col: _unir_bloques(buffers.pop(col)) for col in list(buffers)}, copy=False)
+
+
+# Lee, limpia y compacta el libro con el modo configurado en MODO_LECTURA
+def leer_excel(ruta=RUTA_EXCEL):
+    modo = MODO_LECTURA
+    if modo == "auto":
+        modo = "streaming" if os.path.getsize(ruta) > UMBRAL_STREAMING_BYTES else "completo"
+
+    if modo == "streaming":
+        return leer_excel_streaming(ruta)
+    return compactar_tipos(limpiar_datos(pd.read_excel(ruta)))
+
+
+# Clave de la caché: hash del contenido del libro, su mtime y la versión de la limpieza
+def clave_cache(ruta=RUTA_EXCEL):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    mtime = os.stat(ruta).st_mtime_ns
+    return f"{sha.hexdigest()[:16]}_{mtime}_v{VERSION_LIMPIEZA}"
+
+
+def ruta_cache(ruta=RUTA_EXCEL):
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    return os.path.join(DIRECTORIO_CACHE, f"{base}_{clave_cache(ruta)}.parquet")
+
+
+# Borra los parquet de versiones anteriores del mismo libro
+def _limpiar_cache_obsoleta(ruta, vigente):
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    if not os.path.isdir(DIRECTORIO_CACHE):
+        return
+    for nombre in os.listdir(DIRECTORIO_CACHE):
+        archivo = os.path.join(DIRECTORIO_CACHE, nombre)
+        if nombre.startswith(base + "_") and nombre.endswith(".parquet") and archivo != vigente:
+            os.remove(archivo)
+
+
+# Lee la tabla limpia desde la caché parquet o, si no existe o está obsoleta,
+# parsea el Excel, la limpia y la guarda para el próximo arranque
+def cargar_tabla_limpia(ruta=RUTA_EXCEL, reconstruir=False):
+    archivo_cache = ruta_cache(ruta)
+
+    if not reconstruir and os.path.exists(archivo_cache):
+        try:
+            return pd.read_parquet(archivo_cache)
+        except Exception:
+            # Caché corrupta o sin pyarrow: se vuelve a construir desde el Excel
+            pass
+
+    # La tabla se guarda ordenada por fecha: cualquier rango de fechas es un
+    # tramo contiguo que se resuelve con búsqueda binaria (ver filtros.py). Se
+    # ordena antes de agregar las columnas derivadas para copiar menos columnas
+    df = leer_excel(ruta).sort_values("fecha", kind="stable", ignore_index=True)
+    df = agregar_columnas_derivadas(df)
+    # Solo el tamaño final: reporte_memoria copia la tabla y duplicaría el pico
+    # de memoria de la carga, por eso el detalle queda para `python datos.py`
+    logger.info(
+        "Tabla de ventas: %s filas, %.2f MB en memoria",
+        f"{len(df):,}", df.memory_usage(deep=True, index=False).sum() / 1e6
+    )
+
+    try:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        # Escribir en un temporal y renombrar para no dejar archivos a medias
+        temporal = archivo_cache + ".tmp"
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, archivo_cache)
+        _limpiar_cache_obsoleta(ruta, archivo_cache)
+    except Exception:
+        # Sin pyarrow o sin permisos de escritura la app sigue funcionando sin caché
+        pass
+
+    return df
+
+
+# Avisa en el log de los países sin código ISO-3: no aparecerán en los mapas
+def reportar_paises_sin_iso3(df):
+    if "pais_iso3" not in df.columns:
+        return
+    sin_codigo = sorted(df.loc[df["pais_iso3"].isna(), "pais"].dropna().unique())
+    if sin_codigo:
+        logger.warning(
+            "Países sin código ISO-3 (agregarlos a CODIGOS_ISO3 para verlos en los mapas): %s",
+            ", ".join(sin_codigo)
+        )
+
+
+# Único punto de lectura del Excel: tanto app.py como analisis_estrategico.py
+# comparten esta caché, así el libro se parsea una sola vez por proceso
+@st.cache_data
+def load_data():
+    try:
+        df = cargar_tabla_limpia(reconstruir=RECONSTRUIR_CACHE)
+    except Exception as e:
+        st.error(f"Error al cargar el archivo: {str(e)}")
+        return pd.DataFrame()
+
+    # load_data corre una vez por proceso, así el aviso sale una sola vez
+    reportar_paises_sin_iso3(df)
+    return df
+
+
+# Fuerza la reconstrucción: rehace la caché en disco y vacía todo lo que se
+# construyó sobre la tabla anterior en este proceso. La conexión DuckDB y la
+# fuente Polars apuntan al parquet viejo, que _limpiar_cache_obsoleta acaba de
+# borrar, así que también se descartan. Los imports van aquí porque esos
+# módulos importan datos.py
+def reconstruir_cache(ruta=RUTA_EXCEL):
+    from cache_lru import cache_secciones
+    from cubo import obtener_motor_cubo
+    from filtros import obtener_motor_filtros
+    from geografia import obtener_codigos_iso3
+    from graficos import cache_figuras
+    from motores import obtener_conexion_duckdb, obtener_fuente_polars
+
+    df = cargar_tabla_limpia(ruta, reconstruir=True)
+    load_data.clear()
+    for recurso in (obtener_motor_filtros, obtener_motor_cubo, obtener_conexion_duckdb,
+                    obtener_fuente_polars, obtener_codigos_iso3):
+        recurso.clear()
+    cache_secciones.limpiar()
+    cache_figuras.limpiar()
+    return df
+
+
+# Permite precalcular la caché en el build del despliegue:
+#   python datos.py --reconstruir
+if __name__ == "__main__":
+    df = cargar_tabla_limpia(reconstruir="--reconstruir" in sys.argv[1:])
+    print(f"{len(df):,} filas en {ruta_cache()}")
+    # Resumen de memoria para dimensionar las instancias del despliegue
+    print(reporte_memoria(df).to_string(float_format=lambda x: f"{x:,.1f}"))
@@ -0,0 +1,129 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from functools import cached_property
+
+from datos import load_data
+
+# Dimensiones filtrables desde la barra lateral
+DIMENSIONES_FILTRO = ["pais", "categoria"]
+
+
+# Límites [desde, hasta) de un rango de días completos [fecha_inicio, fecha_fin],
+# o None si el rango está abierto. El motor de filtros y los motores de consulta
+# lo usan por igual, así ninguno trata los extremos distinto
+def limites_fechas(fecha_inicio, fecha_fin):
+    if fecha_inicio is None or fecha_fin is None:
+        return None
+    return pd.Timestamp(fecha_inicio), pd.Timestamp(fecha_fin) + pd.Timedelta(days=1)
+
+
+# Motor de filtros con índices precalculados sobre la tabla limpia:
+# - un bitmap (array booleano) por cada valor de país y de categoría
+# - la tabla viene ordenada por fecha desde datos.py, así que un rango de fechas
+#   se resuelve con dos búsquedas binarias a un tramo contiguo de filas
+# Un cambio de filtro se reduce a unos OR/AND de bitmaps sobre ese tramo y un
+# único take final, sin copiar el DataFrame completo
+class MotorFiltros:
+    def __init__(self, df):
+        # Si la tabla no llega ordenada (p. ej. cargada desde otra fuente) se ordena aquí
+        if "fecha" in df.columns and not df["fecha"].is_monotonic_increasing:
+            df = df.sort_values("fecha", kind="stable")
+        self.df = df
+        self.bitmaps = {}
+        for dim in DIMENSIONES_FILTRO:
+            if dim not in df.columns:
+                continue
+            columna = pd.Categorical(df[dim])
+            self.bitmaps[dim] = {
+                valor: columna.codes == i for i, valor in enumerate(columna.categories)
+            }
+
+        self.fechas = df["fecha"].to_numpy() if "fecha" in df.columns else None
+
+    # Filas que cumplen el OR de los valores seleccionados en una dimensión,
+    # limitado al tramo [inicio, fin)
+    def _mascara_dimension(self, dim, valores, inicio, fin):
+        mascara = np.zeros(fin - inicio, dtype=bool)
+        for valor in valores:
+            bitmap = self.bitmaps[dim].get(valor)
+            if bitmap is not None:
+                mascara |= bitmap[inicio:fin]
+        return mascara
+
+    # Tramo [inicio, fin) de filas con fecha dentro de [fecha_inicio, fecha_fin]
+    # (días completos), en O(log n)
+    def tramo_fechas(self, fecha_inicio=None, fecha_fin=None):
+        limites = limites_fechas(fecha_inicio, fecha_fin)
+        if self.fechas is None or limites is None:
+            return 0, len(self.df)
+        desde, hasta = (np.datetime64(limite) for limite in limites)
+        inicio = int(np.searchsorted(self.fechas, desde, side="left"))
+        fin = int(np.searchsorted(self.fechas, hasta, side="left"))
+        return inicio, max(inicio, fin)
+
+    def posiciones(self, paises=None, categorias=None, fecha_inicio=None, fecha_fin=None):
+        inicio, fin = self.tramo_fechas(fecha_inicio, fecha_fin)
+        mascara = None
+        for dim, valores in (("pais", paises), ("categoria", categorias)):
+            if valores and dim in self.bitmaps:
+                seleccion = self._mascara_dimension(dim, valores, inicio, fin)
+                mascara = seleccion if mascara is None else mascara & seleccion
+
+        if mascara is None:
+            return np.arange(inicio, fin)
+        return inicio + np.flatnonzero(mascara)
+
+    def filtrar(self, paises=None, categorias=None, fecha_inicio=None, fecha_fin=None):
+        posiciones = self.posiciones(paises, categorias, fecha_inicio, fecha_fin)
+        # Si el filtro solo recorta fechas basta con un slice del tramo, sin take
+        if len(posiciones) == 0 or len(posiciones) == posiciones[-1] - posiciones[0] + 1:
+            inicio = posiciones[0] if len(posiciones) else 0
+            return self.df.iloc[inicio:inicio + len(posiciones)]
+        return self.df.take(posiciones)
+
+
+# El motor se construye una vez por proceso y se comparte entre sesiones
+# (cache_resource no copia el objeto en cada rerun, a diferencia de cache_data)
+@st.cache_resource
+def obtener_motor_filtros():
+    return MotorFiltros(load_data())
+
+
+# Selección filtrada que se pasa a cada sección del análisis. Normaliza el estado
+# de los filtros en una clave hashable (la que usan las cachés por sección) y
+# solo materializa las filas o el cubo filtrados si alguna sección los pide
+class SeleccionFiltrada:
+    def __init__(self, paises, categorias, fecha_inicio, fecha_fin):
+        self.paises = tuple(sorted(paises))
+        self.categorias = tuple(sorted(categorias))
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.clave = (self.paises, self.categorias, fecha_inicio, fecha_fin)
+
+    def _argumentos(self):
+        return dict(
+            paises=self.paises,
+            categorias=self.categorias,
+            fecha_inicio=self.fecha_inicio,
+            fecha_fin=self.fecha_fin
+        )
+
+    # Transacciones filtradas
+    @cached_property
+    def filas(self):
+        return obtener_motor_filtros().filtrar(**self._argumentos())
+
+    # Número de transacciones filtradas. Sale de las posiciones del motor (unos
+    # OR/AND de bitmaps), sin materializar las filas si ninguna sección las pidió
+    @cached_property
+    def n_filas(self):
+        if "filas" in self.__dict__:
+            return len(self.filas)
+        return len(obtener_motor_filtros().posiciones(**self._argumentos()))
+
+    # Celdas del cubo preagregado con los mismos filtros
+    @cached_property
+    def cubo(self):
+        from cubo import obtener_motor_cubo
+        return obtener_motor_cubo().filtrar(**self._argumentos())
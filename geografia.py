@@ -0,0 +1,244 @@
+import streamlit as st
+import numpy as np
+import pandas as pd
+import json
+import logging
+import os
+import sys
+import urllib.request
+
+from datos import limpiar_texto, codigo_iso3
+from filtros import obtener_motor_filtros
+
+# Nomenclátor de ciudades incluido en la app: país, ciudad, latitud y longitud.
+# Al leerlo el país pasa a su código ISO-3 y la ciudad por limpiar_texto, igual
+# que en los datos de ventas. Las filas sin ciudad son el centroide del país y
+# sirven de respaldo para ciudades que no estén
+RUTA_NOMENCLATOR = "static/ciudades.csv"
+
+# Mapas base (topojson del mundo) servidos por la propia app como archivos
+# estáticos (server.enableStaticServing en .streamlit/config.toml) en lugar del
+# CDN de Plotly. Plotly.js pide topojsonURL + "world_<resolución>m.json"; la URL
+# es relativa a la página para que funcione también bajo un baseUrlPath
+DIRECTORIO_TOPOJSON = "static/topojson"
+URL_TOPOJSON = "app/static/topojson/"
+URL_TOPOJSON_CDN = "https://cdn.plot.ly/un/"
+
+# Los mapas solo se dibujan a esta resolución (Natural Earth 1:110m), así que es
+# el único topojson que se incluye. static/topojson/world_110m.json viene en el
+# repositorio (países, tierra, costas y océano de Natural Earth 1:110m,
+# simplificado a 0.1° y cuantizado a 10^4), así los mapas no dependen del CDN
+RESOLUCION_MAPAS = 110
+
+# Niveles de detalle del mapa de ciudades: tamaño en grados de la celda de la
+# grilla en la que se agrupan las ciudades cercanas (0 = una burbuja por ciudad)
+NIVELES_DETALLE = {
+    "Mundo": 8.0,
+    "Región": 3.0,
+    "Ciudad": 0.0,
+}
+
+# Máximo de burbujas de ciudad que se envían al navegador. Si un nivel de
+# detalle deja más grupos, la celda se agranda hasta respetarlo
+MAX_MARCADORES_MAPA = int(os.environ.get("EA4_MAX_MARCADORES_MAPA", "300"))
+
+logger = logging.getLogger(__name__)
+
+# Pares (país, ciudad) sin coordenadas ya avisados en el log, para no repetirlos
+# en cada rerun
+_sin_coordenadas_avisadas = set()
+
+
+# Índices hash (ISO-3, ciudad) -> fila e ISO-3 -> centroide sobre las
+# coordenadas del nomenclátor. Se construyen una sola vez por proceso
+class Nomenclator:
+    def __init__(self, tabla):
+        tabla = tabla.drop_duplicates(["pais_iso3", "ciudad"], keep="first")
+        es_centroide = tabla["ciudad"] == ""
+        ciudades = tabla[~es_centroide]
+        centroides = tabla[es_centroide]
+
+        self.indice_ciudades = pd.MultiIndex.from_arrays([ciudades["pais_iso3"], ciudades["ciudad"]])
+        self.coordenadas_ciudades = ciudades[["lat", "lon"]].to_numpy()
+        self.indice_paises = pd.Index(centroides["pais_iso3"])
+        self.coordenadas_paises = centroides[["lat", "lon"]].to_numpy()
+
+    # Latitud y longitud para cada par de las series `paises` (códigos ISO-3) y
+    # `ciudades`, con una búsqueda en el índice por par. Sin la ciudad se usa el
+    # centroide de su país y, sin ninguno de los dos, NaN
+    def coordenadas(self, paises, ciudades):
+        paises = pd.Index(paises.astype(str))
+        ciudades = pd.Index(ciudades.astype(str))
+        coordenadas = np.full((len(paises), 2), np.nan)
+
+        posiciones = self.indice_ciudades.get_indexer(pd.MultiIndex.from_arrays([paises, ciudades]))
+        encontradas = posiciones != -1
+        coordenadas[encontradas] = self.coordenadas_ciudades[posiciones[encontradas]]
+
+        posiciones_pais = self.indice_paises.get_indexer(paises[~encontradas])
+        con_pais = posiciones_pais != -1
+        respaldo = np.flatnonzero(~encontradas)
+        coordenadas[respaldo[con_pais]] = self.coordenadas_paises[posiciones_pais[con_pais]]
+        return coordenadas, encontradas
+
+
+def leer_nomenclator(ruta=RUTA_NOMENCLATOR):
+    tabla = pd.read_csv(ruta, dtype={"pais": str, "ciudad": str, "lat": float, "lon": float}, keep_default_na=False)
+    # Las mismas normalizaciones que se aplican a los datos de ventas
+    tabla["pais_iso3"] = tabla["pais"].map(codigo_iso3)
+    tabla["ciudad"] = tabla["ciudad"].map(limpiar_texto)
+    return tabla.dropna(subset=["pais_iso3"])
+
+
+@st.cache_resource
+def obtener_nomenclator():
+    return Nomenclator(leer_nomenclator())
+
+
+# País -> código ISO-3 tal como quedó en la columna pais_iso3 de la carga
+@st.cache_resource
+def obtener_codigos_iso3():
+    df = obtener_motor_filtros().df
+    if "pais_iso3" not in df.columns:
+        return pd.Series(dtype=object)
+    pares = df[["pais", "pais_iso3"]].dropna(subset=["pais"]).drop_duplicates("pais")
+    return pd.Series(pares["pais_iso3"].astype(object).to_numpy(), index=pd.Index(pares["pais"].astype(str)))
+
+
+# Agrega la columna pais_iso3 a una tabla agregada por país con una búsqueda
+# hash por fila. Los países sin código quedan en None
+def agregar_codigos_iso3(tabla):
+    tabla = tabla.copy()
+    codigos = obtener_codigos_iso3()
+    tabla["pais_iso3"] = codigos.reindex(tabla["pais"].astype(str)).to_numpy()
+    return tabla
+
+
+# Agrega las columnas lat/lon a una tabla agregada por país y ciudad (con su
+# pais_iso3). Las ciudades que caen en el centroide de su país se avisan una vez
+# en el log
+def agregar_coordenadas(tabla):
+    if "pais_iso3" not in tabla.columns:
+        tabla = agregar_codigos_iso3(tabla)
+    tabla = tabla.copy()
+    if tabla.empty:
+        tabla["lat"] = pd.Series(dtype=float)
+        tabla["lon"] = pd.Series(dtype=float)
+        return tabla
+
+    coordenadas, encontradas = obtener_nomenclator().coordenadas(tabla["pais_iso3"], tabla["ciudad"])
+    tabla["lat"] = coordenadas[:, 0]
+    tabla["lon"] = coordenadas[:, 1]
+
+    faltantes = set(zip(tabla["pais"][~encontradas].astype(str), tabla["ciudad"][~encontradas].astype(str)))
+    nuevas = faltantes - _sin_coordenadas_avisadas
+    if nuevas:
+        _sin_coordenadas_avisadas.update(nuevas)
+        logger.warning(
+            "Ciudades sin coordenadas en %s (se ubican en el centro de su país o se omiten del mapa): %s",
+            RUTA_NOMENCLATOR, ", ".join(f"{ciudad} ({pais})" for pais, ciudad in sorted(nuevas))
+        )
+    return tabla
+
+
+# Código de celda de la grilla de `tamano_celda` grados para cada coordenada
+def _celdas(lat, lon, tamano_celda):
+    filas = np.floor((lat + 90) / tamano_celda).astype(np.int64)
+    columnas = np.floor((lon + 180) / tamano_celda).astype(np.int64)
+    return filas * (int(360 / tamano_celda) + 2) + columnas
+
+
+# Agrupa las ciudades (con lat/lon) en burbujas por celda de una grilla de
+# `tamano_celda` grados. Cada burbuja suma ventas y cantidad, se ubica en el
+# centro de sus ciudades ponderado por ventas y se rotula con su ciudad de más
+# ventas (más cuántas otras agrupa). Con tamano_celda = 0 cada ciudad es su
+# propia burbuja. Si quedan más de `max_marcadores` burbujas la celda se agranda
+# (x2) hasta respetar el límite
+def agrupar_ciudades(tabla, tamano_celda, max_marcadores=MAX_MARCADORES_MAPA):
+    tabla = tabla.dropna(subset=["lat", "lon"])
+    lat = tabla["lat"].to_numpy()
+    lon = tabla["lon"].to_numpy()
+
+    while True:
+        if tamano_celda > 0:
+            grupos = _celdas(lat, lon, tamano_celda)
+        else:
+            grupos = np.arange(len(tabla))
+        codigos, unicos = pd.factorize(grupos)
+        if len(unicos) <= max_marcadores:
+            break
+        tamano_celda = tamano_celda * 2 if tamano_celda > 0 else 1.0
+
+    ventas = tabla["ventas"].to_numpy(dtype=float)
+    base = pd.DataFrame({
+        "grupo": codigos,
+        "ventas": ventas,
+        "cantidad": tabla["cantidad"].to_numpy(),
+        "lat_ponderada": lat * ventas,
+        "lon_ponderada": lon * ventas,
+        "ciudad": tabla["ciudad"].astype(str).to_numpy(),
+        "pais": tabla["pais"].astype(str).to_numpy(),
+    })
+    # Ciudad de más ventas de cada grupo como rótulo
+    principales = base.sort_values("ventas", ascending=False, kind="stable").drop_duplicates("grupo")
+    burbujas = base.groupby("grupo").agg(
+        ventas=("ventas", "sum"),
+        cantidad=("cantidad", "sum"),
+        lat_ponderada=("lat_ponderada", "sum"),
+        lon_ponderada=("lon_ponderada", "sum"),
+        n_ciudades=("ciudad", "size"),
+        n_paises=("pais", "nunique"),
+    )
+    burbujas["lat"] = burbujas["lat_ponderada"] / burbujas["ventas"]
+    burbujas["lon"] = burbujas["lon_ponderada"] / burbujas["ventas"]
+    principales = principales.set_index("grupo").reindex(burbujas.index)
+
+    ciudad = principales["ciudad"].str.title()
+    burbujas["rotulo"] = np.where(
+        burbujas["n_ciudades"] > 1,
+        ciudad + " y " + (burbujas["n_ciudades"] - 1).astype(str) + " más",
+        ciudad
+    )
+    burbujas["pais"] = np.where(burbujas["n_paises"] > 1, "Varios países", principales["pais"])
+    return burbujas[["rotulo", "pais", "lat", "lon", "ventas", "cantidad", "n_ciudades"]].reset_index(drop=True)
+
+
+def ruta_topojson(resolucion=RESOLUCION_MAPAS):
+    return os.path.join(DIRECTORIO_TOPOJSON, f"world_{resolucion}m.json")
+
+
+# Config de Plotly para los mapas: el navegador pide el topojson de static/ a la
+# propia app. Solo si alguien borró el archivo Plotly vuelve a su CDN
+def config_mapas():
+    if os.path.exists(ruta_topojson()):
+        return {"topojsonURL": URL_TOPOJSON}
+    return {}
+
+
+# Reemplaza el topojson incluido por el de Plotly (una vez, en el build del
+# despliegue) y lo guarda minificado: sin espacios y con las coordenadas
+# cuantizadas tal como vienen, solo la resolución que usan los mapas
+def descargar_topojson(resolucion=RESOLUCION_MAPAS, url_base=URL_TOPOJSON_CDN):
+    nombre = os.path.basename(ruta_topojson(resolucion))
+    with urllib.request.urlopen(url_base + nombre, timeout=60) as respuesta:
+        topologia = json.load(respuesta)
+    if topologia.get("type") != "Topology":
+        raise ValueError(f"{nombre} no es un topojson válido")
+
+    os.makedirs(DIRECTORIO_TOPOJSON, exist_ok=True)
+    destino = ruta_topojson(resolucion)
+    # Escribir en un temporal y renombrar para no dejar archivos a medias
+    temporal = destino + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(topologia, archivo, separators=(",", ":"))
+    os.replace(temporal, destino)
+    return destino
+
+
+# Actualiza el mapa base en el build del despliegue:
+#   python geografia.py --descargar-topojson
+# Si la descarga falla el comando termina con error y el build se detiene
+if __name__ == "__main__":
+    if "--descargar-topojson" in sys.argv[1:]:
+        destino = descargar_topojson()
+        print(f"{destino}: {os.path.getsize(destino) / 1024:,.0f} KB")
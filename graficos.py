@@ -0,0 +1,288 @@
+import streamlit as st
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import hashlib
+import json
+import os
+
+from cache_lru import CacheLRU
+
+# Resolución de la densidad (KDE) de cada violín: puntos de la malla fija en la
+# que se evalúa y bins del histograma sobre el que se aproxima la suma de kernels
+PUNTOS_KDE = 64
+BINS_KDE = 512
+
+# Máximo de valores atípicos que se dibujan por caja. Si hay más se toma una
+# muestra uniforme de los atípicos ordenados (siempre incluye los extremos)
+MAX_ATIPICOS = 60
+
+# Presupuesto de puntos por figura (suma de todas sus trazas cartesianas). Por
+# encima se reducen las trazas: LTTB para líneas y min/max por tramo para
+# marcadores sueltos
+PRESUPUESTO_PUNTOS = int(os.environ.get("EA4_PRESUPUESTO_PUNTOS", "2000"))
+
+# A partir de este número de puntos una traza Scatter se dibuja con WebGL
+UMBRAL_WEBGL = 1000
+
+# Máximo de anotaciones de texto por figura. Con más categorías las etiquetas se
+# solapan y el layout crece con cada una, así que los valores pasan al hover
+MAX_ANOTACIONES = int(os.environ.get("EA4_MAX_ANOTACIONES", "40"))
+
+# Límites de la caché de figuras serializadas (JSON de Plotly listo para enviar)
+MAX_ENTRADAS_FIGURAS = 512
+TTL_FIGURAS_SEGUNDOS = 30 * 60
+PRESUPUESTO_FIGURAS_BYTES = 64 * 1024 * 1024
+
+
+# Reparte `maximo` posiciones uniformes sobre un array ordenado
+def _muestra_uniforme(valores, maximo):
+    if len(valores) <= maximo:
+        return valores
+    return valores[np.linspace(0, len(valores) - 1, maximo).round().astype(int)]
+
+
+# Estadísticas de un diagrama de caja calculadas en el servidor, con las mismas
+# convenciones que Plotly: cuartiles con interpolación lineal, bigotes hasta el
+# último dato dentro de 1.5 IQR y muesca de 1.57 IQR / sqrt(n)
+def resumen_caja(valores):
+    v = np.sort(np.asarray(valores, dtype=float))
+    v = v[~np.isnan(v)]
+    if len(v) == 0:
+        return None
+    q1, mediana, q3 = np.percentile(v, [25, 50, 75])
+    iqr = q3 - q1
+    limite_inferior = v[np.searchsorted(v, q1 - 1.5 * iqr, side="left")]
+    limite_superior = v[np.searchsorted(v, q3 + 1.5 * iqr, side="right") - 1]
+    atipicos = v[(v < limite_inferior) | (v > limite_superior)]
+    return dict(
+        n=len(v),
+        q1=q1,
+        mediana=mediana,
+        q3=q3,
+        media=v.mean(),
+        limite_inferior=limite_inferior,
+        limite_superior=limite_superior,
+        muesca=1.57 * iqr / np.sqrt(len(v)),
+        atipicos=_muestra_uniforme(atipicos, MAX_ATIPICOS),
+        minimo=v[0],
+        maximo=v[-1],
+    )
+
+
+# Densidad KDE gaussiana evaluada en una malla fija de `puntos` valores. El ancho
+# de banda es la regla de Silverman (la que usa Plotly en sus violines) y la
+# malla se extiende dos anchos de banda más allá de los datos. La suma de
+# kernels se hace sobre un histograma de BINS_KDE bins, así el coste no depende
+# del número de filas
+def kde_en_malla(valores, puntos=PUNTOS_KDE):
+    v = np.asarray(valores, dtype=float)
+    v = v[~np.isnan(v)]
+    if len(v) == 0:
+        return np.array([]), np.array([])
+
+    q1, q3 = np.percentile(v, [25, 75])
+    desviacion = v.std(ddof=1) if len(v) > 1 else 0.0
+    dispersion = min(desviacion, (q3 - q1) / 1.349)
+    # Con IQR nulo se usa la desviación, y con datos constantes un ancho mínimo
+    if dispersion <= 0:
+        dispersion = desviacion if desviacion > 0 else max(abs(v[0]) * 0.01, 1.0)
+    ancho_banda = 1.059 * dispersion * len(v) ** (-1 / 5)
+
+    malla = np.linspace(v.min() - 2 * ancho_banda, v.max() + 2 * ancho_banda, puntos)
+    conteos, bordes = np.histogram(v, bins=BINS_KDE)
+    centros = (bordes[:-1] + bordes[1:]) / 2
+    z = (malla[:, None] - centros[None, :]) / ancho_banda
+    densidad = (conteos[None, :] * np.exp(-0.5 * z ** 2)).sum(axis=1) / (len(v) * ancho_banda * np.sqrt(2 * np.pi))
+    return malla, densidad
+
+
+# Contorno cerrado de un violín centrado en la posición `x` del eje, con la
+# densidad escalada para que su ancho máximo sea `semiancho` a cada lado. Se
+# devuelve en float32: es solo un contorno y así ocupa la mitad en el JSON
+def contorno_violin(x, malla, densidad, semiancho=0.45):
+    if len(malla) == 0 or densidad.max() <= 0:
+        return np.array([], dtype=np.float32), np.array([], dtype=np.float32)
+    ancho = densidad / densidad.max() * semiancho
+    xs = np.concatenate([x - ancho, (x + ancho)[::-1]])
+    ys = np.concatenate([malla, malla[::-1]])
+    return xs.astype(np.float32), ys.astype(np.float32)
+
+
+# Posiciones numéricas del eje x para medir áreas en LTTB: fechas como enteros,
+# números tal cual y categorías (p. ej. mes_ano) por su orden en la serie
+def _eje_numerico(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    if np.issubdtype(x.dtype, np.number):
+        return x.astype(float)
+    return np.arange(len(x), dtype=float)
+
+
+# Largest-Triangle-Three-Buckets: índices de `umbral` puntos que conservan la
+# forma visual de la línea. Siempre incluye el primero y el último
+def indices_lttb(x, y, umbral):
+    n = len(y)
+    if umbral >= n or umbral < 3:
+        return np.arange(n)
+    x = _eje_numerico(x)
+    y = np.asarray(y, dtype=float)
+    bordes = np.linspace(1, n - 1, umbral - 1).astype(int)
+
+    indices = np.empty(umbral, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for i in range(umbral - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Punto medio del tramo siguiente (o el último punto)
+        sig_inicio, sig_fin = fin, bordes[i + 2] if i + 2 < len(bordes) else n
+        x_medio = x[sig_inicio:sig_fin].mean() if sig_fin > sig_inicio else x[-1]
+        y_medio = y[sig_inicio:sig_fin].mean() if sig_fin > sig_inicio else y[-1]
+        # Punto del tramo actual que forma el triángulo de mayor área
+        area = np.abs(
+            (x[anterior] - x_medio) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (y_medio - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(area))
+        indices[i + 1] = anterior
+    return indices
+
+
+# Mínimo y máximo de cada uno de umbral / 2 tramos consecutivos, en orden. Para
+# nubes de marcadores donde importa conservar los extremos
+def indices_min_max(y, umbral):
+    n = len(y)
+    if umbral >= n or umbral < 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    tramo = np.arange(n) * (umbral // 2) // n
+    orden = np.lexsort((y, tramo))
+    cortes = np.flatnonzero(np.diff(tramo[orden])) + 1
+    primeros = np.concatenate([[0], cortes])
+    ultimos = np.concatenate([cortes - 1, [n - 1]])
+    return np.unique(np.concatenate([orden[primeros], orden[ultimos]]))
+
+
+# Tamaños de marcador escalados linealmente de `valores` a [minimo, maximo] en
+# una sola operación de numpy. Sin rango (un valor o todos iguales) todos van
+# al máximo
+def escalar_tamanos(valores, minimo, maximo):
+    valores = np.asarray(valores, dtype=float)
+    if len(valores) == 0:
+        return valores
+    rango = valores.max() - valores.min()
+    if rango <= 0:
+        return np.full(len(valores), float(maximo))
+    return (valores - valores.min()) / rango * (maximo - minimo) + minimo
+
+
+# Lista de anotaciones de layout con un mismo estilo, una por cada par x/y, lista
+# para aplicarse en un único update_layout(annotations=...) en lugar de llamar a
+# add_annotation (validación y mutación del layout) por cada fila
+def anotaciones(x, y, textos, **estilo):
+    return [dict(estilo, x=xi, y=yi, text=texto) for xi, yi, texto in zip(x, y, textos)]
+
+
+# Atributos de una traza que van fila a fila con x/y y se recortan con ella
+_ATRIBUTOS_POR_PUNTO = ["x", "y", "text", "hovertext", "customdata", "ids"]
+_ATRIBUTOS_MARCADOR = ["size", "color", "symbol", "opacity"]
+
+
+def _recortar_traza(traza, indices, n):
+    for nombre in _ATRIBUTOS_POR_PUNTO:
+        valor = traza[nombre]
+        if valor is not None and not isinstance(valor, str) and len(valor) == n:
+            traza[nombre] = np.asarray(valor)[indices]
+    if "marker" in traza:
+        for nombre in _ATRIBUTOS_MARCADOR:
+            valor = traza.marker[nombre]
+            if valor is not None and not isinstance(valor, str) and np.ndim(valor) == 1 and len(valor) == n:
+                traza.marker[nombre] = np.asarray(valor)[indices]
+
+
+# Aplica el presupuesto de puntos a una figura: reparte el presupuesto entre las
+# trazas Scatter en proporción a su tamaño, reduce las que se pasan y dibuja con
+# WebGL (Scattergl) las que aún superan UMBRAL_WEBGL puntos
+def limitar_puntos(fig, presupuesto=None):
+    presupuesto = presupuesto or PRESUPUESTO_PUNTOS
+    trazas = [t for t in fig.data if t.type in ("scatter", "scattergl") and t.y is not None]
+    total = sum(len(t.y) for t in trazas)
+    if total > presupuesto:
+        for traza in trazas:
+            n = len(traza.y)
+            cuota = max(3, presupuesto * n // total)
+            if n <= cuota:
+                continue
+            x = traza.x if traza.x is not None else np.arange(n)
+            # Sin mode explícito Plotly dibuja líneas
+            if "lines" in (traza.mode or "lines") or traza.fill not in (None, "none"):
+                indices = indices_lttb(x, traza.y, cuota)
+            else:
+                indices = indices_min_max(traza.y, cuota)
+            _recortar_traza(traza, indices, n)
+
+    if any(t.type == "scatter" and len(t.y) > UMBRAL_WEBGL for t in trazas):
+        datos = []
+        for traza in fig.data:
+            if traza.type == "scatter" and traza.y is not None and len(traza.y) > UMBRAL_WEBGL:
+                propiedades = traza.to_plotly_json()
+                traza = go.Scattergl({k: v for k, v in propiedades.items() if k in go.Scattergl._valid_props and k != "type"})
+            datos.append(traza)
+        fig.data = []
+        fig.add_traces(datos)
+    return fig
+
+
+cache_figuras = CacheLRU(MAX_ENTRADAS_FIGURAS, TTL_FIGURAS_SEGUNDOS, PRESUPUESTO_FIGURAS_BYTES)
+
+
+def _alimentar_huella(h, valor):
+    if isinstance(valor, pd.DataFrame):
+        h.update(repr((list(valor.columns), list(valor.dtypes.astype(str)))).encode())
+        h.update(pd.util.hash_pandas_object(valor, index=True).to_numpy().tobytes())
+    elif isinstance(valor, (pd.Series, pd.Index)):
+        h.update(repr((valor.name, str(valor.dtype))).encode())
+        h.update(pd.util.hash_pandas_object(valor, index=isinstance(valor, pd.Series)).to_numpy().tobytes())
+    elif isinstance(valor, np.ndarray):
+        h.update(repr((valor.dtype.str, valor.shape)).encode())
+        h.update(np.ascontiguousarray(valor).tobytes())
+    elif isinstance(valor, dict):
+        h.update(b"{")
+        for clave in sorted(valor, key=repr):
+            _alimentar_huella(h, clave)
+            _alimentar_huella(h, valor[clave])
+        h.update(b"}")
+    elif isinstance(valor, (list, tuple)):
+        h.update(b"[")
+        for elemento in valor:
+            _alimentar_huella(h, elemento)
+        h.update(b"]")
+    else:
+        h.update(repr(valor).encode())
+    h.update(b"|")
+
+
+# Huella del contenido de los datos de una figura (frames agregados, arrays,
+# dicts y parámetros). Dos llamadas con los mismos datos dan la misma huella
+def huella(*valores):
+    h = hashlib.blake2b(digest_size=16)
+    _alimentar_huella(h, valores)
+    return h.hexdigest()
+
+
+# Muestra una figura construida por `construir(*datos)` pasando por la caché de
+# figuras. La clave es el nombre del gráfico más la huella de sus datos, así un
+# rerun con los mismos agregados reenvía el JSON guardado sin ejecutar el código
+# que arma la figura (plotly express, layout, validación). Solo se reconstruye
+# un Figure sin validar a partir del JSON, que es lo que pide st.plotly_chart
+def mostrar_figura_cacheada(nombre, construir, *datos, presupuesto=None, config=None):
+    presupuesto = presupuesto or PRESUPUESTO_PUNTOS
+    clave = (nombre, huella(datos, presupuesto))
+    encontrado, spec = cache_figuras.obtener(clave)
+    if not encontrado:
+        fig = limitar_puntos(construir(*datos), presupuesto)
+        spec = pio.to_json(fig, validate=False)
+        cache_figuras.guardar(clave, spec, tamano=len(spec))
+    st.plotly_chart(go.Figure(json.loads(spec), _validate=False), use_container_width=True, config=config)
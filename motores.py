@@ -0,0 +1,362 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import importlib.util
+import os
+import sys
+import time
+
+from datos import ruta_cache
+from filtros import obtener_motor_filtros, limites_fechas, SeleccionFiltrada
+from cubo import DIMENSIONES_CUBO, enrollar
+
+# Motor que ejecuta las agregaciones del análisis estratégico:
+# - "pandas": enrolla el cubo preagregado y, para medidas no aditivas, agrupa
+#   las transacciones filtradas
+# - "duckdb": ejecuta las mismas agregaciones como SQL sobre la tabla limpia
+#   (su caché parquet si existe) en una base DuckDB en proceso y multihilo
+# - "polars": arma filtro + agregación como un único plan LazyFrame sobre la
+#   misma tabla; el optimizador empuja los filtros al lector parquet y ejecuta
+#   en todos los núcleos. A pandas solo vuelve el resultado agregado
+MOTORES_DISPONIBLES = ["pandas", "duckdb", "polars"]
+MOTOR_CONSULTAS = os.environ.get("EA4_MOTOR_CONSULTAS", "pandas")
+
+# Medidas que el cubo puede servir directamente: (columna, función) -> medida del cubo
+MEDIDAS_DESDE_CUBO = {
+    ("ventas", "sum"): "ventas",
+    ("cantidad", "sum"): "cantidad",
+    ("satisfaccion", "mean"): "satisfaccion",
+    ("ventas", "count"): "transacciones",
+}
+
+
+# DuckDB y Polars solo se importan al usar su motor por primera vez, así el
+# motor por defecto (pandas) no paga su tiempo de carga ni su memoria
+def _importar_duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("El motor 'duckdb' requiere instalar el paquete duckdb") from None
+    return duckdb
+
+
+def _importar_polars():
+    try:
+        import polars
+    except ImportError:
+        raise ImportError("El motor 'polars' requiere instalar el paquete polars") from None
+    return polars
+
+
+def _motor_instalado(paquete):
+    return importlib.util.find_spec(paquete) is not None
+
+
+# Traducción de cada función de agregación a SQL
+FUNCIONES_SQL = {
+    "sum": "SUM({col})",
+    "mean": "AVG({col})",
+    "nunique": "COUNT(DISTINCT {col})",
+    "count": "COUNT({col})",
+    "min": "MIN({col})",
+    "max": "MAX({col})",
+}
+
+
+# Expresión Polars de cada función de agregación sobre la expresión de su
+# columna (pl.col). nunique ignora los nulos, igual que en pandas
+FUNCIONES_POLARS = {
+    "sum": lambda columna: columna.sum(),
+    "mean": lambda columna: columna.mean(),
+    "nunique": lambda columna: columna.drop_nulls().n_unique(),
+    "count": lambda columna: columna.count(),
+    "min": lambda columna: columna.min(),
+    "max": lambda columna: columna.max(),
+}
+
+
+# Aplica filtros de igualdad adicionales ({columna: valor}) sobre un DataFrame
+def _filtrar_donde(df, donde):
+    if not donde:
+        return df
+    mascara = np.ones(len(df), dtype=bool)
+    for col, valor in donde.items():
+        mascara &= (df[col] == valor).to_numpy()
+    return df[mascara]
+
+
+# Con observed=False se devuelven todas las combinaciones de categorías de las
+# claves: sumas y conteos a 0, promedios como NaN (igual que groupby de pandas)
+def _completar_combinaciones(resultado, claves, medidas, tipos):
+    indice = pd.MultiIndex.from_product(
+        [tipos[c].categories for c in claves], names=claves
+    )
+    resultado = resultado.set_index(claves).reindex(indice)
+    for alias, (_, funcion) in medidas.items():
+        if funcion != "mean":
+            resultado[alias] = resultado[alias].fillna(0)
+    return resultado.reset_index()
+
+
+# Lleva el resultado de un motor externo a la forma del camino de pandas: mismos
+# tipos categóricos en las claves, mismo orden y mismas combinaciones
+def _ajustar_resultado(resultado, claves, medidas, observed):
+    tipos = obtener_motor_filtros().df.dtypes
+    if not observed:
+        resultado = _completar_combinaciones(resultado, claves, medidas, tipos)
+    for c in claves:
+        resultado[c] = resultado[c].astype(tipos[c])
+    return resultado.sort_values(claves, ignore_index=True)[claves + list(medidas)]
+
+
+# El cubo sirve una agregación si todas las medidas salen de él y las claves
+# (incluidas las de `donde`) están en su grano
+def _servible_desde_cubo(claves, medidas):
+    return (
+        all(c in DIMENSIONES_CUBO for c in claves)
+        and all(m in MEDIDAS_DESDE_CUBO for m in medidas.values())
+    )
+
+
+# Todas las medidas se calculan en una sola pasada, sin merges posteriores:
+# enrollando el cubo si todas son aditivas y las claves están en su grano, o con
+# un único groupby sobre las transacciones filtradas en cualquier otro caso
+def agregar_pandas(seleccion, claves, medidas, observed=True, donde=None):
+    if _servible_desde_cubo(claves + list(donde or {}), medidas):
+        enrollado = enrollar(_filtrar_donde(seleccion.cubo, donde), claves, observed=observed)
+        return enrollado[claves + [MEDIDAS_DESDE_CUBO[m] for m in medidas.values()]].set_axis(
+            claves + list(medidas), axis=1
+        )
+    return (
+        _filtrar_donde(seleccion.filas, donde)
+        .groupby(claves, observed=observed)
+        .agg(**medidas)
+        .reset_index()
+    )
+
+
+# Conexión DuckDB compartida por el proceso. La tabla "ventas" lee la caché
+# parquet de datos.py cuando existe (sin duplicar memoria) o, si no, una copia
+# de la tabla limpia en memoria
+@st.cache_resource
+def obtener_conexion_duckdb():
+    duckdb = _importar_duckdb()
+    conexion = duckdb.connect(database=":memory:")
+    archivo = ruta_cache()
+    if os.path.exists(archivo):
+        # Las sentencias DDL no admiten parámetros: la ruta va escapada en el SQL
+        ruta_sql = archivo.replace("'", "''")
+        conexion.execute(f"CREATE VIEW ventas AS SELECT * FROM read_parquet('{ruta_sql}')")
+    else:
+        df = obtener_motor_filtros().df
+        conexion.register("ventas_df", df)
+        conexion.execute("CREATE TABLE ventas AS SELECT * FROM ventas_df")
+        conexion.unregister("ventas_df")
+    return conexion
+
+
+def agregar_duckdb(seleccion, claves, medidas, observed=True, donde=None):
+    tipos = obtener_motor_filtros().df.dtypes
+
+    columnas = [f'CAST("{c}" AS VARCHAR) AS "{c}"' for c in claves]
+    for alias, (col, funcion) in medidas.items():
+        expresion = FUNCIONES_SQL[funcion].format(col=f'"{col}"')
+        # Las sumas de enteros se devuelven como BIGINT y no como HUGEINT
+        if funcion in ("sum", "nunique", "count") and pd.api.types.is_integer_dtype(tipos[col]):
+            expresion = f"CAST({expresion} AS BIGINT)"
+        columnas.append(f'{expresion} AS "{alias}"')
+
+    condiciones = []
+    parametros = {}
+    if seleccion.paises:
+        condiciones.append("list_contains($paises, CAST(pais AS VARCHAR))")
+        parametros["paises"] = list(seleccion.paises)
+    if seleccion.categorias:
+        condiciones.append("list_contains($categorias, CAST(categoria AS VARCHAR))")
+        parametros["categorias"] = list(seleccion.categorias)
+    limites = limites_fechas(seleccion.fecha_inicio, seleccion.fecha_fin)
+    if limites is not None:
+        condiciones.append("fecha >= $desde AND fecha < $hasta")
+        parametros["desde"], parametros["hasta"] = (limite.to_pydatetime() for limite in limites)
+    for i, (col, valor) in enumerate((donde or {}).items()):
+        condiciones.append(f'CAST("{col}" AS VARCHAR) = $donde_{i}')
+        parametros[f"donde_{i}"] = str(valor)
+    # groupby de pandas descarta las claves nulas
+    condiciones += [f'"{c}" IS NOT NULL' for c in claves]
+
+    sql = f"SELECT {', '.join(columnas)} FROM ventas"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += " GROUP BY " + ", ".join(str(i + 1) for i in range(len(claves)))
+
+    # Cada consulta usa su propio cursor: las sesiones de Streamlit son hilos
+    cursor = obtener_conexion_duckdb().cursor()
+    try:
+        resultado = cursor.execute(sql, parametros).df()
+    finally:
+        cursor.close()
+
+    return _ajustar_resultado(resultado, claves, medidas, observed)
+
+
+# Origen perezoso de la tabla limpia para Polars: escanea la caché parquet (solo
+# lee las columnas y grupos de filas que pide cada plan) o, si no existe, envuelve
+# una copia de la tabla en memoria
+@st.cache_resource
+def obtener_fuente_polars():
+    pl = _importar_polars()
+    archivo = ruta_cache()
+    if os.path.exists(archivo):
+        return pl.scan_parquet(archivo)
+    return pl.from_pandas(obtener_motor_filtros().df).lazy()
+
+
+def agregar_polars(seleccion, claves, medidas, observed=True, donde=None):
+    pl = _importar_polars()
+    tipos = obtener_motor_filtros().df.dtypes
+
+    condiciones = []
+    if seleccion.paises:
+        condiciones.append(pl.col("pais").cast(pl.String).is_in(list(seleccion.paises)))
+    if seleccion.categorias:
+        condiciones.append(pl.col("categoria").cast(pl.String).is_in(list(seleccion.categorias)))
+    limites = limites_fechas(seleccion.fecha_inicio, seleccion.fecha_fin)
+    if limites is not None:
+        desde, hasta = (limite.to_pydatetime() for limite in limites)
+        condiciones.append((pl.col("fecha") >= desde) & (pl.col("fecha") < hasta))
+    for col, valor in (donde or {}).items():
+        condiciones.append(pl.col(col).cast(pl.String) == str(valor))
+    # groupby de pandas descarta las claves nulas
+    condiciones += [pl.col(c).is_not_null() for c in claves]
+
+    agregaciones = []
+    for alias, (col, funcion) in medidas.items():
+        expresion = FUNCIONES_POLARS[funcion](pl.col(col))
+        # Sumas de enteros en Int64 (int32 podría desbordar) y conteos como int64
+        if funcion == "sum" and pd.api.types.is_integer_dtype(tipos[col]):
+            expresion = pl.col(col).cast(pl.Int64).sum()
+        elif funcion in ("nunique", "count"):
+            expresion = expresion.cast(pl.Int64)
+        agregaciones.append(expresion.alias(alias))
+
+    # Un solo plan: el filtro se empuja al escaneo y solo se leen las columnas usadas
+    plan = (
+        obtener_fuente_polars()
+        .filter(*condiciones)
+        .group_by([pl.col(c).cast(pl.String) for c in claves])
+        .agg(agregaciones)
+    )
+    resultado = plan.collect().to_pandas()
+    return _ajustar_resultado(resultado, claves, medidas, observed)
+
+
+AGREGADORES = {
+    "pandas": agregar_pandas,
+    "duckdb": agregar_duckdb,
+    "polars": agregar_polars,
+}
+
+
+# Punto único de agregación para las secciones del análisis.
+# `medidas` es {alias: (columna, función)} con funciones de FUNCIONES_SQL;
+# `donde` admite filtros de igualdad extra sobre la selección
+def agregar(seleccion, claves, medidas, observed=True, donde=None, motor=None):
+    motor = motor or MOTOR_CONSULTAS
+    if motor not in AGREGADORES:
+        raise ValueError(f"Motor de consultas desconocido: {motor}. Opciones: {', '.join(MOTORES_DISPONIBLES)}")
+    return AGREGADORES[motor](seleccion, list(claves), medidas, observed=observed, donde=donde)
+
+
+# Planificador de agregaciones. Cada sección declara (al importar su módulo) qué
+# medidas pide sobre un conjunto de claves; el plan junta las medidas del mismo
+# conjunto y las resuelve con una única llamada a agregar(). Las que el cubo
+# puede servir se planean aparte de las que necesitan las transacciones, para
+# que una medida no aditiva no saque del cubo a las demás. El plan no cachea:
+# cada sección memoiza su propio resultado (memoizar_por_filtros)
+class PlanAgregaciones:
+    def __init__(self):
+        self.medidas = {}  # (claves, observed, desde_cubo) -> {alias: (columna, función)}
+
+    def pedir(self, claves, medidas, observed=True):
+        grupo = (tuple(claves), observed, _servible_desde_cubo(list(claves), medidas))
+        pedidas = self.medidas.setdefault(grupo, {})
+        for alias, medida in medidas.items():
+            if pedidas.setdefault(alias, medida) != medida:
+                raise ValueError(f"La medida '{alias}' ya está pedida sobre {list(claves)} con otra definición")
+        return ConsultaPlaneada(self, grupo, list(medidas))
+
+    # Resultado fusionado con todas las medidas del grupo
+    def resolver(self, seleccion, grupo, donde=None):
+        claves, observed, _ = grupo
+        return agregar(seleccion, claves, self.medidas[grupo], observed=observed, donde=donde)
+
+
+# Medidas de una sección dentro del plan: devuelve solo sus columnas, como copia
+# para que la sección pueda añadir columnas sin avisos de pandas
+class ConsultaPlaneada:
+    def __init__(self, plan, grupo, alias):
+        self.plan = plan
+        self.grupo = grupo
+        self.alias = alias
+
+    def resolver(self, seleccion, donde=None):
+        claves = list(self.grupo[0])
+        return self.plan.resolver(seleccion, self.grupo, donde)[claves + self.alias].copy()
+
+
+plan_secciones = PlanAgregaciones()
+
+
+# Agregaciones representativas de las secciones del análisis, para comparar motores
+CONSULTAS_COMPARACION = [
+    (["categoria", "metodo_pago"], {"ventas": ("ventas", "sum")}, True),
+    (["mes_ano"], {"satisfaccion": ("satisfaccion", "mean")}, True),
+    (["pais"], {
+        "ventas": ("ventas", "sum"),
+        "cantidad": ("cantidad", "sum"),
+        "satisfaccion": ("satisfaccion", "mean"),
+        "id_cliente": ("id_cliente", "nunique"),
+    }, True),
+    (["pais", "ciudad"], {"ventas": ("ventas", "sum"), "cantidad": ("cantidad", "sum")}, True),
+    (["rango_edad", "genero_cliente"], {
+        "ventas": ("ventas", "sum"),
+        "id_cliente": ("id_cliente", "nunique"),
+    }, False),
+]
+
+
+# Ejecuta las mismas consultas con cada motor instalado sobre la misma tabla y
+# compara tiempos y resultados contra pandas
+def comparar_motores(repeticiones=5):
+    df = obtener_motor_filtros().df
+    fecha_min, fecha_max = df["fecha"].min().date(), df["fecha"].max().date()
+    paises = sorted(df["pais"].dropna().unique())
+    selecciones = {
+        "sin filtros": SeleccionFiltrada([], [], fecha_min, fecha_max),
+        "filtrada": SeleccionFiltrada(paises[:len(paises) // 2], [], fecha_min + (fecha_max - fecha_min) / 2, fecha_max),
+    }
+    instalados = {"pandas": True, "duckdb": _motor_instalado("duckdb"), "polars": _motor_instalado("polars")}
+
+    for nombre, seleccion in selecciones.items():
+        print(f"Selección {nombre}:")
+        referencia = [agregar(seleccion, c, m, observed=o, motor="pandas") for c, m, o in CONSULTAS_COMPARACION]
+        for motor in [m for m in MOTORES_DISPONIBLES if instalados[m]]:
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                resultados = [agregar(seleccion, c, m, observed=o, motor=motor) for c, m, o in CONSULTAS_COMPARACION]
+            ms = (time.perf_counter() - inicio) / repeticiones * 1000
+
+            coincide = True
+            for esperado, obtenido in zip(referencia, resultados):
+                try:
+                    pd.testing.assert_frame_equal(esperado, obtenido, check_dtype=False)
+                except AssertionError:
+                    coincide = False
+            print(f"  {motor:<8} {ms:8.1f} ms  {'coincide con pandas' if coincide else 'DIFIERE de pandas'}")
+
+
+if __name__ == "__main__":
+    if "--comparar" in sys.argv:
+        comparar_motores()
+    else:
+        print("Uso: python motores.py --comparar")